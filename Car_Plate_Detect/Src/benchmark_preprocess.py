@@ -0,0 +1,94 @@
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+import pytesseract
+
+from ocr_engine import OCREngine
+from plate_formats import PlateGrammar
+from plate_preprocess import PlatePreprocessor, legacy_preprocess
+from config import TESSERACT_PATH, OCR_BACKEND, PLATE_TARGET_HEIGHT, PLATE_MAX_PIXELS
+
+
+parser = argparse.ArgumentParser(description="Time plate preprocessing and OCR per crop, original against pixel-budgeted")
+parser.add_argument("--crops", default=None, help="folder of plate crop images, synthetic plates if not given")
+parser.add_argument("--tesseract", default=TESSERACT_PATH)
+parser.add_argument("--target-height", type=int, default=PLATE_TARGET_HEIGHT)
+parser.add_argument("--max-pixels", type=int, default=PLATE_MAX_PIXELS)
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--no-ocr", action="store_true", help="only time the preprocessing")
+args = parser.parse_args()
+
+
+def synthetic_crops():
+    """Plates of 10 to 160 pixels height, a few of them tilted"""
+    crops = []
+    for height in (10, 16, 24, 40, 80, 160):
+        for angle in (0, 6):
+            plate = np.full((80, 320, 3), 205, np.uint8)
+            cv2.rectangle(plate, (6, 6), (313, 73), (40, 40, 40), 3)
+            cv2.putText(plate, "AB12CDE", (28, 58), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (20, 20, 20), 4)
+            if angle:
+                matrix = cv2.getRotationMatrix2D((160, 40), angle, 1.0)
+                plate = cv2.warpAffine(plate, matrix, (320, 80), borderMode=cv2.BORDER_REPLICATE)
+            crops.append((f"{height}px {angle}deg", cv2.resize(plate, (height * 4, height), interpolation=cv2.INTER_AREA)))
+    return crops
+
+
+def read_crops(folder):
+    crops = []
+    for path in sorted(glob.glob(os.path.join(folder, "*"))):
+        image = cv2.imread(path)
+        if image is not None:
+            crops.append((os.path.basename(path), image))
+    return crops
+
+
+crops = read_crops(args.crops) if args.crops else synthetic_crops()
+methods = {
+    "original": legacy_preprocess,
+    "budgeted": PlatePreprocessor(args.target_height, args.max_pixels),
+}
+
+ocr = None
+if not args.no_ocr:
+    pytesseract.pytesseract.tesseract_cmd = args.tesseract
+    tessdata_path = os.path.join(os.path.dirname(args.tesseract), "tessdata")
+    ocr = OCREngine(backend=OCR_BACKEND, tessdata_path=tessdata_path if os.path.isdir(tessdata_path) else None)
+grammar = PlateGrammar()
+
+totals = {name: [0.0, 0.0, 0] for name in methods}
+for label, crop in crops:
+    line = f"{label:>16}"
+    for name, preprocess in methods.items():
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            images = preprocess(crop)
+        prep_time = (time.perf_counter() - start) / args.repeat
+
+        ocr_time = 0.0
+        plate = ""
+        if ocr is not None:
+            start = time.perf_counter()
+            texts = []
+            for image in images:
+                texts.extend(ocr.read_all(image))
+            ocr_time = time.perf_counter() - start
+            plate = grammar.best(texts)[0] or "-"
+
+        totals[name][0] += prep_time
+        totals[name][1] += ocr_time
+        totals[name][2] += images[0].size
+        line += f" | {name}: {images[0].shape[1]:>4}x{images[0].shape[0]:<4} {prep_time * 1000:6.2f} ms"
+        if ocr is not None:
+            line += f" + OCR {ocr_time * 1000:7.1f} ms {plate:>8}"
+    print(line)
+
+for name, (prep_time, ocr_time, pixels) in totals.items():
+    summary = f"{name:>9}: {pixels / len(crops):9.0f} px, preprocessing {prep_time / len(crops) * 1000:6.2f} ms/crop"
+    if ocr is not None:
+        summary += f", OCR {ocr_time / len(crops) * 1000:7.1f} ms/crop"
+    print(summary)
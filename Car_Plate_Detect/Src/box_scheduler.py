@@ -0,0 +1,55 @@
+import time
+
+
+class BoxScheduler:
+    """Decides which YOLO boxes of an image get OCR'd, and in which order.
+
+    Boxes under min_confidence or smaller than min_width x min_height
+    full-resolution pixels are dropped, the rest are ranked by confidence
+    times area so the most promising plate is read first, and at most
+    max_boxes are kept. time_budget (seconds) bounds the OCR of one image:
+    the first box is always read, later boxes only start while the budget
+    lasts. None disables a limit.
+    """
+
+    def __init__(self, min_confidence=0.0, min_width=0, min_height=0, max_boxes=None, time_budget=None):
+        self.min_confidence = min_confidence
+        self.min_width = min_width
+        self.min_height = min_height
+        self.max_boxes = max_boxes
+        self.time_budget = time_budget
+
+    def rank(self, frame, results):
+        """Full-resolution xyxy boxes of the results worth reading, best first"""
+        candidates = []
+        for r in results:
+            if r.boxes is None:
+                continue
+            for box in r.boxes:
+                confidence = float(box.conf[0])
+                if confidence < self.min_confidence:
+                    continue
+                xyxy = frame.to_full(box.xyxy[0].cpu().numpy())
+                width, height = xyxy[2] - xyxy[0], xyxy[3] - xyxy[1]
+                if width < self.min_width or height < self.min_height:
+                    continue
+                candidates.append((confidence * width * height, xyxy))
+
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        return [xyxy for _, xyxy in candidates[:self.max_boxes]]
+
+    def deadline(self):
+        """perf_counter time after which no further box is started, None without a budget"""
+        return time.perf_counter() + self.time_budget if self.time_budget is not None else None
+
+    @staticmethod
+    def expired(deadline):
+        return deadline is not None and time.perf_counter() > deadline
+
+    def snapshot(self):
+        return {
+            "min_confidence": self.min_confidence,
+            "min_size": [self.min_width, self.min_height],
+            "max_boxes": self.max_boxes,
+            "time_budget": self.time_budget,
+        }
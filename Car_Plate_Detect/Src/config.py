@@ -1,12 +1,64 @@
 import os
 from pathlib import Path
 
+from plate_formats import DEFAULT_FORMATS
+
 # Model Configuration
 MODEL_PATH = r"E:\car_plate_detect\models\best.pt"
 
+# Inference backend: "ultralytics" runs best.pt with PyTorch, "onnxruntime"
+# and "openvino" run a fixed-shape ONNX export of it on the CPU without torch.
+# The export is written next to best.pt on first use (best.onnx, or
+# best_int8.onnx with INFERENCE_INT8 for dynamically quantized weights)
+INFERENCE_BACKEND = "ultralytics"
+INFERENCE_IMGSZ = 640  # must match the imgsz the model was trained with
+INFERENCE_INT8 = False
+
+# Dual-resolution detection: YOLO runs on the image downscaled to this long
+# side and the boxes are mapped back, plate crops for OCR are cut from the
+# full resolution image. None gives YOLO the full image. REDUCED_DECODE
+# decodes large JPEGs at 1/2-1/8 scale for detection and at full size only
+# once a plate was found, cheaper when most images have no plate
+DETECT_IMAGE_SIZE = INFERENCE_IMGSZ
+REDUCED_DECODE = False
+
 # Tesseract Configuration
 TESSERACT_PATH = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
+# OCR engine: "auto" uses in-process tesserocr handles when installed, else pytesseract
+OCR_BACKEND = "auto"
+OCR_POOL_SIZE = 2  # Tesseract handles kept per psm config
+
+# OCR cascade: stop OCR on a plate once a candidate matches a plate format exactly,
+# without corrections, and scores at least this (25 accepts every default format,
+# 45 only UK AA00AAA), None runs every threshold/psm combination
+OCR_CASCADE_SCORE = 25
+OCR_CASCADE_STATS_PATH = str(Path(__file__).parent / "ocr_cascade_stats.json")
+
+# Detection workers: "thread" shares one detector, "process" loads one per worker
+# and none in the API process itself
+DETECT_POOL_MODE = "thread"
+DETECT_WORKERS = 4  # also the most images a YOLO batch can collect in thread mode
+DETECT_QUEUE_SIZE = 8  # requests waiting for a worker before /detect answers 503
+DETECT_TIMEOUT = 10.0  # seconds, requests still unanswered by then get 504
+
+# YOLO micro-batching: concurrent requests share one model call of up to
+# YOLO_BATCH_SIZE images, the first waits at most YOLO_BATCH_WAIT seconds.
+# None calls the model once per request
+YOLO_BATCH_SIZE = 4
+YOLO_BATCH_WAIT = 0.005
+
+# Detection cache: /detect results by hash of the uploaded bytes, and OCR
+# readings by perceptual hash (dHash) of each plate crop, so a standing car
+# is only OCR'd again once its crop changes. LRU with a time to live and a
+# memory cap per level, 0 entries disables a level
+UPLOAD_CACHE_SIZE = 1024
+CROP_CACHE_SIZE = 1024
+CACHE_TTL = 30.0  # seconds
+CACHE_MAX_BYTES = 4 * 1024 * 1024  # per level
+CROP_HASH_SIZE = 16  # dHash of 2 x 16 x 16 bits
+CROP_HASH_DISTANCE = 4  # bits a crop may differ from a cached one, a changed character flips ~10
+
 # API Configuration
 API_HOST = "0.0.0.0"
 API_PORT = 8000
@@ -26,12 +78,43 @@ LOG_LEVEL = "INFO"
 # File Upload Configuration
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff"}
+MAX_BATCH_IMAGES = 8  # images per /detect/batch request
+
+# Plate preprocessing: crops are resized to this height (fewer rows if wider
+# than the pixel budget allows) before thresholding and OCR. None keeps the
+# original max(2, 300 // height) upscaling
+PLATE_TARGET_HEIGHT = 100
+PLATE_MAX_PIXELS = 60000
+
+# Plate formats, by priority: A = letter, 0 = digit, X = either, anything else
+# literal. bonus is added to the score of candidates in that format, and OCR
+# confusions (O/0, I/1, G/6, B/8, S/5) are fixed per position to match it.
+# The table lives in plate_formats.py; add a country with e.g.
+# DEFAULT_FORMATS + [{"name": "DE", "pattern": "AA0000", "bonus": 10}]
+PLATE_FORMATS = DEFAULT_FORMATS
+
+# Registered vehicles for gate access: CSV with a "plate" column (other
+# columns are kept as the registration details), loaded at startup when the
+# file exists. /detect?match=registry returns the closest registered plate
+# within REGISTRY_MAX_DISTANCE, where an OCR confusion (O/0, B/8, ...) costs
+# 1 and any other wrong, missing or extra character 2 (at most 3)
+REGISTRY_CSV_PATH = str(Path(__file__).parent / "registered_plates.csv")
+REGISTRY_MAX_DISTANCE = 2
 
 # Processing Configuration
 MIN_PLATE_LENGTH = 4
 MAX_PLATE_LENGTH = 12
 CONFIDENCE_THRESHOLD = 0.5
 
+# Box scheduling: plate boxes under CONFIDENCE_THRESHOLD or smaller than
+# MIN_PLATE_SIZE (width, height in full resolution pixels) are not OCR'd, the
+# rest are read by confidence x area, at most MAX_PLATES_PER_IMAGE of them.
+# Once OCR of an image has taken OCR_TIME_BUDGET seconds no further box is
+# started and the best plate so far is returned. None disables a limit
+MIN_PLATE_SIZE = (40, 12)
+MAX_PLATES_PER_IMAGE = 4
+OCR_TIME_BUDGET = 2.0
+
 def validate_paths():
     """Validate that required files exist"""
     if not os.path.exists(MODEL_PATH):
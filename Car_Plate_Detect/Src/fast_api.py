@@ -1,17 +1,30 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Response
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
-import cv2
-import numpy as np
+import asyncio
 import logging
+import os
 from pathlib import Path
 
 # Import our custom modules
 from plate_processor import PlateDetector
+from worker_pool import DetectionPool, PoolFullError, DeadlineExceededError
+from detection_cache import LRUCache, content_key
+from ocr_cascade import OCRCascadeStats
+from plate_registry import PlateRegistry
 from config import (
     MODEL_PATH, TESSERACT_PATH, API_HOST, API_PORT, 
     API_TITLE, API_DESCRIPTION, API_VERSION,
     CORS_ORIGINS, CORS_CREDENTIALS, CORS_METHODS, CORS_HEADERS,
-    LOG_LEVEL, MAX_FILE_SIZE, ALLOWED_EXTENSIONS,
+    LOG_LEVEL, MAX_FILE_SIZE, ALLOWED_EXTENSIONS, MAX_BATCH_IMAGES, OCR_BACKEND, OCR_POOL_SIZE,
+    OCR_CASCADE_SCORE, OCR_CASCADE_STATS_PATH,
+    DETECT_POOL_MODE, DETECT_WORKERS, DETECT_QUEUE_SIZE, DETECT_TIMEOUT,
+    YOLO_BATCH_SIZE, YOLO_BATCH_WAIT,
+    UPLOAD_CACHE_SIZE, CROP_CACHE_SIZE, CACHE_TTL, CACHE_MAX_BYTES, CROP_HASH_SIZE, CROP_HASH_DISTANCE,
+    PLATE_FORMATS, PLATE_TARGET_HEIGHT, PLATE_MAX_PIXELS,
+    INFERENCE_BACKEND, INFERENCE_IMGSZ, INFERENCE_INT8, DETECT_IMAGE_SIZE, REDUCED_DECODE,
+    CONFIDENCE_THRESHOLD, MIN_PLATE_SIZE, MAX_PLATES_PER_IMAGE, OCR_TIME_BUDGET,
+    REGISTRY_CSV_PATH, REGISTRY_MAX_DISTANCE,
     validate_paths
 )
 
@@ -43,18 +56,82 @@ app.add_middleware(
     allow_headers=CORS_HEADERS,
 )
 
-# Initialize plate detector
+# Initialize plate detector, in process mode only the workers have one
 detector = None
+detection_pool = None
+# What /health and /info report about the detector, from a worker in process mode
+detector_info = None
+# OCR cascade win counts, in process mode read from the file the workers save to
+cascade_stats = None
+upload_cache = LRUCache(UPLOAD_CACHE_SIZE, CACHE_TTL, CACHE_MAX_BYTES) if UPLOAD_CACHE_SIZE else None
+registry = PlateRegistry()
+startup_future = None
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the plate detector on startup"""
-    global detector
+def load_detector():
+    """Build the plate detector (model export and warm-up included), its worker pool and the registry"""
+    global detector, detection_pool, detector_info, cascade_stats
+    detector_args = (MODEL_PATH, TESSERACT_PATH, OCR_BACKEND, OCR_POOL_SIZE)
+    detector_kwargs = {
+        "cascade_score": OCR_CASCADE_SCORE, "cascade_stats_path": OCR_CASCADE_STATS_PATH,
+        "batch_size": YOLO_BATCH_SIZE, "batch_wait": YOLO_BATCH_WAIT,
+        "crop_cache_size": CROP_CACHE_SIZE, "cache_ttl": CACHE_TTL, "cache_max_bytes": CACHE_MAX_BYTES,
+        "crop_hash_size": CROP_HASH_SIZE, "crop_hash_distance": CROP_HASH_DISTANCE,
+        "plate_formats": PLATE_FORMATS, "plate_height": PLATE_TARGET_HEIGHT, "plate_max_pixels": PLATE_MAX_PIXELS,
+        "inference_backend": INFERENCE_BACKEND, "inference_imgsz": INFERENCE_IMGSZ, "inference_int8": INFERENCE_INT8,
+        "detect_size": DETECT_IMAGE_SIZE, "reduced_decode": REDUCED_DECODE,
+        "min_confidence": CONFIDENCE_THRESHOLD, "min_plate_size": MIN_PLATE_SIZE,
+        "max_plates": MAX_PLATES_PER_IMAGE, "ocr_time_budget": OCR_TIME_BUDGET,
+    }
     try:
-        detector = PlateDetector(MODEL_PATH, TESSERACT_PATH)
+        if DETECT_POOL_MODE == "process":
+            # Detection runs in the worker processes, a model and OCR handles here would sit idle
+            plate_detector = None
+            pool = DetectionPool(
+                None, DETECT_POOL_MODE, DETECT_WORKERS, DETECT_QUEUE_SIZE, DETECT_TIMEOUT,
+                # A worker process only ever has one image in flight, nothing to batch
+                detector_args=detector_args, detector_kwargs={**detector_kwargs, "batch_size": None}
+            )
+        else:
+            plate_detector = PlateDetector(*detector_args, **detector_kwargs)
+            pool = DetectionPool(plate_detector, DETECT_POOL_MODE, DETECT_WORKERS, DETECT_QUEUE_SIZE, DETECT_TIMEOUT)
+        info = pool.worker_info()
         logger.info("Plate detector initialized successfully")
+        
+        combos = info.pop("cascade_combos")
+        if plate_detector is not None:
+            cascade_stats = plate_detector.cascade
+        elif combos is not None:
+            cascade_stats = OCRCascadeStats(combos, OCR_CASCADE_STATS_PATH)
+        detector, detector_info = plate_detector, info
+        # Set last, requests are served once it is there
+        detection_pool = pool
     except Exception as e:
         logger.error(f"Failed to initialize plate detector: {e}")
+    
+    if os.path.exists(REGISTRY_CSV_PATH):
+        try:
+            registry.load_csv(REGISTRY_CSV_PATH)
+        except Exception as e:
+            logger.error(f"Failed to load registered plates: {e}")
+
+@app.on_event("startup")
+async def startup_event():
+    """Load the detector in the background, /health answers "starting" and /detect 503 until it is ready"""
+    global startup_future
+    startup_future = asyncio.get_running_loop().run_in_executor(None, load_detector)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the worker pool and persist the OCR cascade statistics"""
+    # A pool still being built would be left running
+    if startup_future is not None:
+        await startup_future
+    if detection_pool is not None:
+        detection_pool.shutdown()
+    if detector is not None:
+        if detector.cascade is not None:
+            detector.cascade.save()
+        detector.close()
 
 def validate_image_file(file: UploadFile) -> bool:
     """Validate uploaded image file"""
@@ -80,23 +157,49 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint, ready once the model has run its warm-up inference"""
+    ready = detection_pool is not None and detector_info["ready"]
     return {
-        "status": "healthy", 
-        "model_loaded": detector is not None and detector.is_model_loaded()
+        "status": "healthy" if ready else "starting",
+        "model_loaded": detection_pool is not None and detector_info["model_loaded"],
+        "ready": ready
+    }
+
+def plate_result(plate_number, match):
+    """The plate string, or with match=registry the closest registered plate and its distance"""
+    if match is None:
+        return plate_number or "NO_PLATE_DETECTED"
+    
+    registered, distance = registry.match(plate_number, REGISTRY_MAX_DISTANCE)
+    return {
+        "plate": plate_number or "NO_PLATE_DETECTED",
+        "registered_plate": registered,
+        "distance": distance,
+        "registered": registered is not None,
     }
 
 @app.post("/detect")
-async def detect_plate(file: UploadFile = File(...)):
+async def detect_plate(response: Response, file: UploadFile = File(...), match: Optional[str] = None):
     """
     Upload an image and get the detected license plate number.
-    Returns only the plate number as a string.
+    Returns only the plate number as a string, or with ?match=registry
+    {"plate", "registered_plate", "distance", "registered"} where
+    registered_plate is the closest registered plate within
+    REGISTRY_MAX_DISTANCE of the OCR result. The X-OCR-Calls header
+    tells how many OCR passes the request needed and X-Cache whether the
+    same upload was answered from the cache. X-OCR-Budget-Exhausted is
+    set when OCR_TIME_BUDGET ran out before every plate box was read.
+    Detection runs in the worker pool: 503 with Retry-After when it is
+    full, 504 when the request is not answered within DETECT_TIMEOUT.
     """
     
     # Check if detector is initialized
-    if detector is None:
+    if detection_pool is None:
         raise HTTPException(status_code=503, detail="Service not ready - detector not initialized")
     
+    if match not in (None, "registry"):
+        raise HTTPException(status_code=400, detail="match must be 'registry'")
+    
     # Validate file
     if not validate_image_file(file):
         raise HTTPException(
@@ -115,24 +218,48 @@ async def detect_plate(file: UploadFile = File(...)):
                 detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
             )
         
-        # Convert to OpenCV image
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        logger.info(f"Processing image: {file.filename}, {len(contents)} bytes")
+        
+        # A camera re-sending the same frame is answered from the cache
+        key = content_key(contents)
+        found, plate_number = upload_cache.get(key) if upload_cache is not None else (False, None)
+        if found:
+            response.headers["X-Cache"] = "HIT"
+            response.headers["X-OCR-Calls"] = "0"
+            return plate_result(plate_number, match)
         
-        if image is None:
+        # Decode and detect in the worker pool, off the event loop
+        try:
+            plate_number, stats = await detection_pool.detect(contents)
+        except PoolFullError as e:
+            logger.warning(f"Rejected {file.filename}: {e}")
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy - detection queue is full",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except DeadlineExceededError as e:
+            logger.warning(f"Dropped {file.filename}: {e}")
+            raise HTTPException(status_code=504, detail=str(e))
+        except ValueError:
             raise HTTPException(status_code=400, detail="Could not decode image")
         
-        logger.info(f"Processing image: {file.filename}, size: {image.shape}")
+        # The best plate of a partly read image is not cached as the answer for it
+        budget_exhausted = stats.get("budget_exhausted", False)
+        if upload_cache is not None and not budget_exhausted:
+            upload_cache.put(key, plate_number)
         
-        # Detect plate number
-        plate_number = detector.detect_plate_number(image)
+        response.headers["X-Cache"] = "MISS"
+        response.headers["X-OCR-Calls"] = str(stats["ocr_calls"])
+        if budget_exhausted:
+            response.headers["X-OCR-Budget-Exhausted"] = "true"
+        logger.info(f"OCR calls: {stats['ocr_calls']}")
         
         if plate_number:
             logger.info(f"Plate detected: {plate_number}")
-            return plate_number  # Return only the string
         else:
             logger.info("No plate detected")
-            return "NO_PLATE_DETECTED"
+        return plate_result(plate_number, match)
             
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -141,20 +268,106 @@ async def detect_plate(file: UploadFile = File(...)):
         logger.error(f"Error processing image: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
+@app.post("/detect/batch")
+async def detect_plate_batch(response: Response, files: List[UploadFile] = File(...), consensus: bool = False):
+    """
+    Upload several images, e.g. a burst of frames of one car, and get the
+    plate number of each. The images go through YOLO together; with
+    ?consensus=true the frames also vote on a single plate number.
+    """
+    
+    if detection_pool is None:
+        raise HTTPException(status_code=503, detail="Service not ready - detector not initialized")
+    
+    if len(files) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Too many images. Maximum per batch: {MAX_BATCH_IMAGES}")
+    
+    for file in files:
+        if not validate_image_file(file):
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Invalid file {file.filename}. Must be an image with extension: {', '.join(ALLOWED_EXTENSIONS)}"
+            )
+    
+    try:
+        contents_list = []
+        for file in files:
+            contents = await file.read()
+            if len(contents) > MAX_FILE_SIZE:
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"File {file.filename} too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
+                )
+            contents_list.append(contents)
+        
+        logger.info(f"Processing batch of {len(files)} images")
+        
+        try:
+            output, stats = await detection_pool.detect_batch(contents_list, consensus)
+        except PoolFullError as e:
+            logger.warning(f"Rejected batch: {e}")
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy - detection queue is full",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except DeadlineExceededError as e:
+            logger.warning(f"Dropped batch: {e}")
+            raise HTTPException(status_code=504, detail=str(e))
+        
+        response.headers["X-OCR-Calls"] = str(stats["ocr_calls"])
+        if stats.get("budget_exhausted"):
+            response.headers["X-OCR-Budget-Exhausted"] = "true"
+        
+        return {
+            "results": [
+                {"filename": file.filename, "plate": plate or "NO_PLATE_DETECTED"}
+                for file, plate in zip(files, output["plates"])
+            ],
+            "consensus": (output["consensus"] or "NO_PLATE_DETECTED") if consensus else None
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing batch: {str(e)}")
+
+def cascade_snapshot():
+    """OCR cascade win counts, the workers' latest saved totals in process mode"""
+    if cascade_stats is None:
+        return None
+    if detector is None:
+        cascade_stats.load()
+    return cascade_stats.snapshot()
+
 @app.get("/info")
 async def api_info():
     """Get API information and configuration"""
     return {
         "api_title": API_TITLE,
         "api_version": API_VERSION,
-        "model_loaded": detector is not None and detector.is_model_loaded(),
+        "model_loaded": detection_pool is not None and detector_info["model_loaded"],
+        "inference_backend": detector_info["inference_backend"] if detection_pool is not None else None,
+        "ocr_backend": detector_info["ocr_backend"] if detection_pool is not None else None,
+        "ocr_cascade": cascade_snapshot(),
+        "yolo_batching": detector.batcher.snapshot() if detector is not None and detector.batcher is not None else None,
+        "box_scheduler": detector.scheduler.snapshot() if detector is not None else None,
+        "cache": {
+            "uploads": upload_cache.snapshot() if upload_cache is not None else None,
+            "plate_crops": detector.crop_cache.snapshot() if detector is not None and detector.crop_cache is not None else None,
+        },
+        "worker_pool": detection_pool.snapshot() if detection_pool is not None else None,
+        "registry": registry.snapshot(),
         "max_file_size_mb": MAX_FILE_SIZE // (1024*1024),
         "allowed_extensions": list(ALLOWED_EXTENSIONS),
+        "max_batch_images": MAX_BATCH_IMAGES,
         "endpoints": {
             "GET /": "API information",
             "GET /health": "Health check",
             "GET /info": "Detailed API information",
-            "POST /detect": "Upload image and detect plate number"
+            "POST /detect": "Upload image and detect plate number, ?match=registry adds the closest registered plate",
+            "POST /detect/batch": "Upload several images, get a plate number per image and optionally a consensus"
         }
     }
 
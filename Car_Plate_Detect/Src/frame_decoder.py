@@ -0,0 +1,118 @@
+import cv2
+import numpy as np
+
+# JPEG scale factors libjpeg can decode at directly
+REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+
+def jpeg_size(data):
+    """(width, height) from the frame header of JPEG bytes, None for other formats"""
+    data = bytes(data)
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            i += 2
+            continue
+        # SOF0-SOF15, except DHT, JPG and DAC which share the range
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+
+    return None
+
+
+def reduction_factor(width, height, detect_size):
+    """Largest JPEG scale factor that keeps the long side at detect_size or more"""
+    for factor in REDUCED_FLAGS:
+        if max(width, height) // factor >= detect_size:
+            return factor
+    return 1
+
+
+def downscale(image, detect_size):
+    """Image with its long side at most detect_size, the way YOLO's letterbox would resize it"""
+    height, width = image.shape[:2]
+    scale = detect_size / max(height, width)
+    if scale >= 1:
+        return image
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+
+
+class PlateFrame:
+    """An image for YOLO at detection size, with the full resolution kept for the plate crops.
+
+    Boxes found on the detection image are mapped to full resolution with
+    to_full. A frame made with reduced decoding holds the encoded bytes
+    and only decodes the full image when full is first used, so frames
+    without plates never pay for it.
+    """
+
+    def __init__(self, detection, full=None, data=None):
+        self.detection = detection
+        self._full = full
+        self._data = data
+
+    @classmethod
+    def from_array(cls, image, detect_size=None):
+        if detect_size is None:
+            return cls(image, image)
+        return cls(downscale(image, detect_size), image)
+
+    @classmethod
+    def from_bytes(cls, data, detect_size=None, reduced=False):
+        """Decoded frame of encoded image bytes, None if they cannot be decoded.
+
+        Without reduced the image is decoded once and downscaled. With
+        reduced, JPEGs at least twice the detection size are decoded at 1/2,
+        1/4 or 1/8 scale for detection and again at full size on demand.
+        """
+        buffer = np.frombuffer(data, np.uint8)
+
+        if reduced and detect_size is not None:
+            size = jpeg_size(data)
+            factor = reduction_factor(*size, detect_size) if size else 1
+            if factor > 1:
+                detection = cv2.imdecode(buffer, REDUCED_FLAGS[factor])
+                if detection is None:
+                    return None
+                return cls(downscale(detection, detect_size), data=buffer)
+
+        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+        return cls.from_array(image, detect_size)
+
+    @property
+    def full(self):
+        if self._full is None:
+            self._full = cv2.imdecode(self._data, cv2.IMREAD_COLOR)
+            self._data = None
+            if self._full is None:
+                raise ValueError("Could not decode image at full resolution")
+        return self._full
+
+    def to_full(self, xyxy):
+        """Boxes (one xyxy or an (n, 4) array) on the detection image in full resolution pixels"""
+        if self.detection is self._full:
+            return np.asarray(xyxy, dtype=np.float32)
+        full_height, full_width = self.full.shape[:2]
+        height, width = self.detection.shape[:2]
+        scale = np.array([full_width / width, full_height / height] * 2, dtype=np.float32)
+        return np.asarray(xyxy, dtype=np.float32) * scale
@@ -0,0 +1,201 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("ultralytics", "onnxruntime", "openvino")
+
+
+class HostArray(np.ndarray):
+    """NumPy array with the .cpu() / .numpy() calls of a torch tensor, so code
+    written against Ultralytics results reads exported model results unchanged."""
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return np.asarray(self)
+
+
+class PlateBox:
+    """One detection, shaped like an Ultralytics Boxes row"""
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(1, 4).view(HostArray)
+        self.conf = np.asarray([conf], dtype=np.float32).view(HostArray)
+        self.cls = np.asarray([cls], dtype=np.float32).view(HostArray)
+
+
+class PlateResults:
+    """Detections of one image, shaped like an Ultralytics Results"""
+
+    def __init__(self, boxes, orig_shape):
+        self.boxes = boxes
+        self.orig_shape = orig_shape
+
+
+def letterbox(image, size=640, color=114):
+    """Resizes keeping the aspect ratio and pads to size x size.
+
+    Returns the 1x3xHxW float32 RGB blob, the scale and the (x, y) padding.
+    """
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+
+    canvas = np.full((size, size, 3), color, dtype=np.uint8)
+    left, top = int(round(pad_x - 0.1)), int(round(pad_y - 0.1))
+    canvas[top:top + new_height, left:left + new_width] = cv2.resize(
+        image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+    blob = canvas[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+    return np.ascontiguousarray(blob), scale, (left, top)
+
+
+def nms(boxes, scores, iou_threshold=0.7):
+    """Indices of the boxes kept by greedy non-maximum suppression, best first"""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores)
+
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        intersection = w * h
+        iou = intersection / (areas[i] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+
+    return np.array(keep, dtype=np.int64)
+
+
+def postprocess(output, scale, pad, orig_shape, conf_threshold=0.25, iou_threshold=0.7, max_det=300):
+    """Boxes of one image from a YOLOv8/11 detect head output of shape (4 + classes, anchors)"""
+    predictions = output.T
+    class_scores = predictions[:, 4:]
+    classes = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(classes)), classes]
+
+    keep = scores > conf_threshold
+    predictions, scores, classes = predictions[keep], scores[keep], classes[keep]
+    if not len(scores):
+        return PlateResults([], orig_shape)
+
+    cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    # Class-aware NMS, boxes of different classes are pushed apart
+    offsets = classes[:, None].astype(np.float32) * 4096
+    keep = nms(boxes + offsets, scores, iou_threshold)[:max_det]
+
+    boxes = boxes[keep]
+    boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - pad[0]) / scale, 0, orig_shape[1])
+    boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - pad[1]) / scale, 0, orig_shape[0])
+
+    return PlateResults([PlateBox(box, scores[i], classes[i]) for box, i in zip(boxes, keep)], orig_shape)
+
+
+class ExportedModel(ABC):
+    """A YOLO detector exported with a fixed 1x3ximgszximgsz input, called like an Ultralytics YOLO"""
+
+    def __init__(self, imgsz=640, conf_threshold=0.25, iou_threshold=0.7):
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+
+    @abstractmethod
+    def infer(self, blob):
+        """Raw detect head outputs of one letterboxed blob"""
+
+    def predict_one(self, image):
+        blob, scale, pad = letterbox(image, self.imgsz)
+        output = self.infer(blob)[0]
+        return postprocess(output, scale, pad, image.shape[:2], self.conf_threshold, self.iou_threshold)
+
+    def __call__(self, source, **kwargs):
+        # The input shape is fixed, so batches run one image at a time
+        images = source if isinstance(source, (list, tuple)) else [source]
+        return [self.predict_one(image) for image in images]
+
+
+class ONNXRuntimeModel(ExportedModel):
+
+    def __init__(self, path, imgsz=640, threads=0, **kwargs):
+        super().__init__(imgsz, **kwargs)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVINOModel(ExportedModel):
+
+    def __init__(self, path, imgsz=640, device="CPU", **kwargs):
+        super().__init__(imgsz, **kwargs)
+        import openvino as ov
+
+        core = ov.Core()
+        self.compiled = core.compile_model(core.read_model(path), device)
+        self.request = self.compiled.create_infer_request()
+
+    def infer(self, blob):
+        return self.request.infer({0: blob})[self.compiled.output(0)]
+
+
+def exported_path(model_path, int8=False):
+    """Where the ONNX export of model_path is kept, next to the .pt file"""
+    stem, _ = os.path.splitext(model_path)
+    return f"{stem}_int8.onnx" if int8 else f"{stem}.onnx"
+
+
+def export_model(model_path, imgsz=640, int8=False):
+    """Exports the Ultralytics model to ONNX once, with a fixed input shape, and returns the file.
+
+    int8 quantizes the weights dynamically, no calibration images needed.
+    OpenVINO reads the same ONNX file, so both backends share one export.
+    """
+    path = exported_path(model_path, int8)
+    if os.path.exists(path):
+        return path
+
+    onnx_path = exported_path(model_path)
+    if not os.path.exists(onnx_path):
+        from ultralytics import YOLO
+        # Ultralytics writes best.onnx next to best.pt
+        onnx_path = YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=False, simplify=True)
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(onnx_path, path, weight_type=QuantType.QUInt8)
+
+    logger.info(f"Exported {model_path} to {path}")
+    return path
+
+
+def load_model(model_path, backend="ultralytics", imgsz=640, int8=False, threads=0):
+    """A callable YOLO model for the backend, exported on first use"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+
+    if backend == "ultralytics":
+        from ultralytics import YOLO
+        return YOLO(model_path)
+
+    path = export_model(model_path, imgsz, int8)
+    if backend == "onnxruntime":
+        return ONNXRuntimeModel(path, imgsz, threads)
+    return OpenVINOModel(path, imgsz)
@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class OCRCascadeStats:
+    """Online win counts of each (threshold method, psm) OCR combination.
+
+    A combination wins a plate when it produced the candidate that was
+    finally picked. Combinations are tried in order of their smoothed win
+    rate, and the counts are persisted as JSON so the order survives restarts.
+
+    Detection worker processes share the stats file: each save adds the
+    counts this process gathered since its last save to the file's, under
+    a lock file, and takes back the merged totals.
+    """
+
+    def __init__(self, combos, path=None, save_every=20):
+        self.combos = [tuple(combo) for combo in combos]
+        self.path = path
+        self.save_every = save_every
+        self.attempts = {combo: 0 for combo in self.combos}
+        self.wins = {combo: 0 for combo in self.combos}
+        # Counts not in the file yet
+        self._new_attempts = {combo: 0 for combo in self.combos}
+        self._new_wins = {combo: 0 for combo in self.combos}
+        self._updates = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _key(combo):
+        return f"{combo[0]}:{combo[1]}"
+
+    def _read(self):
+        """Persisted counts as {key: {"attempts", "wins"}}, empty without a readable file"""
+        if not os.path.exists(self.path):
+            return {}
+
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load OCR cascade stats: {e}")
+            return {}
+
+    def load(self):
+        """Load persisted counts, ignoring combinations that are no longer configured"""
+        if not self.path:
+            return
+
+        data = self._read()
+        with self._lock:
+            for combo in self.combos:
+                entry = data.get(self._key(combo)) or {}
+                self.attempts[combo] = int(entry.get("attempts", 0)) + self._new_attempts[combo]
+                self.wins[combo] = int(entry.get("wins", 0)) + self._new_wins[combo]
+
+    @contextmanager
+    def _file_lock(self, timeout=5.0, stale=30.0):
+        """Exclusive lock shared by the processes using the stats path, as an O_EXCL lock file"""
+        lock_path = f"{self.path}.lock"
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    # Left behind by a process that died while saving
+                    if time.time() - os.path.getmtime(lock_path) > stale:
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"{lock_path} is held by another process")
+                time.sleep(0.01)
+
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+    def save(self):
+        if not self.path:
+            return
+
+        with self._lock:
+            new_attempts, new_wins = self._new_attempts, self._new_wins
+            self._new_attempts = {combo: 0 for combo in self.combos}
+            self._new_wins = {combo: 0 for combo in self.combos}
+
+        # Per-process tmp file, detection worker processes share the stats path
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with self._save_lock:
+            try:
+                with self._file_lock():
+                    data = self._read()
+                    for combo in self.combos:
+                        entry = data.get(self._key(combo)) or {}
+                        attempts = int(entry.get("attempts", 0)) + new_attempts[combo]
+                        wins = int(entry.get("wins", 0)) + new_wins[combo]
+                        data[self._key(combo)] = {
+                            "attempts": attempts,
+                            "wins": wins,
+                            "win_rate": round((wins + 1) / (attempts + 2), 4),
+                        }
+                    with open(tmp_path, "w") as f:
+                        json.dump(data, f, indent=2)
+                    os.replace(tmp_path, self.path)
+            except (OSError, TimeoutError) as e:
+                logger.warning(f"Could not save OCR cascade stats: {e}")
+                # Keep the counts for the next save
+                with self._lock:
+                    for combo in self.combos:
+                        self._new_attempts[combo] += new_attempts[combo]
+                        self._new_wins[combo] += new_wins[combo]
+                return
+
+        # Take over what the other processes saved
+        self.load()
+
+    def win_rate(self, combo):
+        # Laplace smoothing, so untried combinations start at 0.5
+        return (self.wins[combo] + 1) / (self.attempts[combo] + 2)
+
+    def order(self):
+        """Combinations by descending win rate, ties keep the configured order"""
+        with self._lock:
+            return sorted(self.combos, key=self.win_rate, reverse=True)
+
+    def record(self, attempted, winner):
+        with self._lock:
+            for combo in attempted:
+                self.attempts[combo] += 1
+                self._new_attempts[combo] += 1
+            if winner is not None:
+                self.wins[winner] += 1
+                self._new_wins[winner] += 1
+            self._updates += 1
+            save = self.save_every and self._updates % self.save_every == 0
+
+        if save:
+            self.save()
+
+    def _snapshot(self):
+        return {
+            self._key(combo): {
+                "attempts": self.attempts[combo],
+                "wins": self.wins[combo],
+                "win_rate": round(self.win_rate(combo), 4),
+            }
+            for combo in self.combos
+        }
+
+    def snapshot(self):
+        with self._lock:
+            return self._snapshot()
@@ -0,0 +1,125 @@
+import logging
+import queue
+import threading
+
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+PLATE_WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+
+class OCREngine:
+    """Tesseract OCR for a fixed set of page segmentation modes.
+
+    With the tesserocr binding installed, long-lived Tesseract API handles are
+    kept in a thread-safe pool per psm and images are passed to them as raw
+    NumPy buffers. Without it every call falls back to pytesseract, which
+    starts a tesseract process and writes temp files per call.
+    """
+
+    def __init__(self, psm_modes=(8, 7, 6), whitelist=PLATE_WHITELIST, backend="auto",
+                 pool_size=2, tessdata_path=None, lang="eng"):
+        self.psm_modes = tuple(psm_modes)
+        self.whitelist = whitelist
+        self.pool_size = pool_size
+        self.tessdata_path = tessdata_path
+        self.lang = lang
+
+        if backend == "auto":
+            backend = "tesserocr" if tesserocr is not None else "pytesseract"
+        elif backend == "tesserocr" and tesserocr is None:
+            logger.warning("tesserocr is not installed, falling back to pytesseract")
+            backend = "pytesseract"
+        self.backend = backend
+
+        self._pools = {psm: queue.Queue() for psm in self.psm_modes}
+        self._created = {psm: 0 for psm in self.psm_modes}
+        self._lock = threading.Lock()
+
+        logger.info(f"OCR engine using {self.backend} for psm modes {self.psm_modes}")
+
+    def _config(self, psm):
+        return f"--oem 3 --psm {psm} -c tessedit_char_whitelist={self.whitelist}"
+
+    def _create_api(self, psm):
+        kwargs = {"lang": self.lang, "psm": psm, "oem": tesserocr.OEM.DEFAULT}
+        if self.tessdata_path:
+            kwargs["path"] = self.tessdata_path
+
+        api = tesserocr.PyTessBaseAPI(**kwargs)
+        api.SetVariable("tessedit_char_whitelist", self.whitelist)
+        return api
+
+    def _acquire(self, psm):
+        pool = self._pools[psm]
+        try:
+            return pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created[psm] < self.pool_size
+            if create:
+                self._created[psm] += 1
+
+        if create:
+            try:
+                return self._create_api(psm)
+            except Exception:
+                with self._lock:
+                    self._created[psm] -= 1
+                raise
+
+        # Every handle for this psm is busy, wait for one to come back
+        return pool.get()
+
+    def image_to_string(self, image, psm):
+        """OCR one grayscale or BGR uint8 image with the given page segmentation mode."""
+        if self.backend == "pytesseract":
+            return pytesseract.image_to_string(image, config=self._config(psm)).strip()
+
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        if channels == 3:
+            # Tesseract expects RGB byte order
+            image = np.ascontiguousarray(image[:, :, ::-1])
+
+        api = self._acquire(psm)
+        try:
+            api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+            return api.GetUTF8Text().strip()
+        finally:
+            api.Clear()
+            self._pools[psm].put(api)
+
+    def read_all(self, image):
+        """OCR the image once per configured psm, "" for configs that fail."""
+        results = []
+        for psm in self.psm_modes:
+            try:
+                results.append(self.image_to_string(image, psm))
+            except Exception as e:
+                logger.warning(f"OCR config failed: {e}")
+                results.append("")
+        return results
+
+    def close(self):
+        """Release every pooled Tesseract handle."""
+        for pool in self._pools.values():
+            while True:
+                try:
+                    api = pool.get_nowait()
+                except queue.Empty:
+                    break
+                api.End()
+
+        with self._lock:
+            self._created = {psm: 0 for psm in self.psm_modes}
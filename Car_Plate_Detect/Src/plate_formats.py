@@ -0,0 +1,220 @@
+import re
+
+# A = letter, 0 = digit, X = letter or digit, anything else is literal.
+# Formats are listed by priority, a candidate gets the bonus of the first
+# format it starts with (formats with bonus 0 are only extracted). This is
+# the one table, config.PLATE_FORMATS uses it unless changed there.
+DEFAULT_FORMATS = [
+    {"name": "UK", "pattern": "AA00AAA", "bonus": 20},
+    {"name": "US", "pattern": "AAA0000", "bonus": 15},
+    {"name": "US reversed", "pattern": "000AAA", "bonus": 0},
+]
+
+# Letters OCR commonly reads instead of the digit, fixed where a format expects the other class
+DEFAULT_CONFUSIONS = {"O": "0", "I": "1", "G": "6", "B": "8", "S": "5"}
+
+# Score taken off a candidate per position a format had to correct
+CORRECTION_PENALTY = 5
+
+
+class PlateFormat:
+    """One plate format compiled to per-position character classes.
+
+    search finds the format anywhere in a cleaned string, also where a
+    position holds the confusable character of the other class, and exact
+    matches a candidate that starts with the format as is. fix maps each
+    position's confusable characters to the class the format expects, one
+    way: letters to digits in digit positions, digits to letters in letter
+    positions.
+    """
+
+    def __init__(self, name, pattern, bonus=0, confusions=None):
+        self.name = name
+        self.pattern = pattern
+        self.bonus = bonus
+        self.length = len(pattern)
+
+        confusions = DEFAULT_CONFUSIONS if confusions is None else confusions
+        to_digit = dict(confusions)
+        to_letter = {digit: letter for letter, digit in confusions.items()}
+
+        loose = []
+        exact = []
+        self.fix = []
+        for symbol in pattern:
+            if symbol == "A":
+                exact.append("[A-Z]")
+                loose.append(f"[A-Z{''.join(to_letter)}]")
+                self.fix.append(to_letter)
+            elif symbol == "0":
+                exact.append("[0-9]")
+                loose.append(f"[0-9{''.join(to_digit)}]")
+                self.fix.append(to_digit)
+            elif symbol == "X":
+                exact.append("[A-Z0-9]")
+                loose.append("[A-Z0-9]")
+                self.fix.append({})
+            else:
+                exact.append(re.escape(symbol))
+                loose.append(re.escape(symbol))
+                self.fix.append({})
+
+        # Lookahead so overlapping occurrences are all found
+        self.search = re.compile(f"(?=({''.join(loose)}))")
+        self.loose = re.compile("".join(loose))
+        self.exact = re.compile("".join(exact))
+
+    def correct(self, text):
+        """Replaces the confusable characters of a text of this format's length"""
+        if self.exact.match(text):
+            return text
+        return "".join(fix.get(char, char) for fix, char in zip(self.fix, text))
+
+    def corrections(self, text):
+        """Number of positions correct changes"""
+        if self.exact.match(text):
+            return 0
+        return sum(char in fix for fix, char in zip(self.fix, text))
+
+
+class PlateGrammar:
+    """Cleans, extracts, corrects and scores plate candidates from OCR text.
+
+    Formats come from a table (see DEFAULT_FORMATS), so supporting another
+    country's plates only needs a new table entry. read does everything for
+    one OCR string: clean it, cut the generic 5-8 character chunks, extract
+    every format occurrence with its confusions corrected, and score each
+    distinct candidate.
+
+    Corrected occurrences are only extracted when the string holds no
+    format as read, at most max_corrections positions are corrected, and
+    every correction costs CORRECTION_PENALTY, so digit noise such as
+    "8800588" never becomes a full-score plate.
+    """
+
+    def __init__(self, formats=None, confusions=None, min_length=4, chunk_length=(5, 8), max_corrections=2):
+        formats = DEFAULT_FORMATS if formats is None else formats
+        self.formats = [
+            PlateFormat(f["name"], f["pattern"], f.get("bonus", 0), confusions) for f in formats
+        ]
+        self.bonus_formats = [f for f in self.formats if f.bonus]
+        self.min_length = min_length
+        self.chunk_length = chunk_length
+        self.max_corrections = max_corrections
+        self._non_plate = re.compile(r"[^A-Z0-9]")
+        # The psm/threshold combinations of a crop mostly return the same few strings
+        self._reads = {}
+        self.max_cached_reads = 4096
+
+    def clean(self, text):
+        """Upper case letters and digits only"""
+        return self._non_plate.sub("", text.upper())
+
+    def chunks(self, cleaned):
+        """Consecutive chunks of at most chunk_length[1] characters that are long enough to be a plate"""
+        shortest, longest = self.chunk_length
+        if len(cleaned) <= longest:
+            return [cleaned] if len(cleaned) >= shortest else []
+        return [cleaned[i:i + longest] for i in range(0, len(cleaned), longest)
+                if len(cleaned) - i >= shortest]
+
+    def candidates(self, cleaned):
+        """Generic chunks and format occurrences of a cleaned string, mapped to their number of corrections"""
+        found = dict.fromkeys(self.chunks(cleaned), 0)
+        exact_seen = False
+        for plate_format in self.formats:
+            if len(cleaned) < plate_format.length:
+                continue
+            occurrences = []
+            for match in plate_format.search.finditer(cleaned):
+                text = match.group(1)
+                occurrences.append((plate_format.correct(text), plate_format.corrections(text)))
+
+            # A format read as is beats corrected readings by itself and by the formats listed after it
+            exact_seen = exact_seen or any(corrections == 0 for _, corrections in occurrences)
+            for candidate, corrections in occurrences:
+                if corrections and (exact_seen or corrections > self.max_corrections):
+                    continue
+                if corrections < found.get(candidate, corrections + 1):
+                    found[candidate] = corrections
+        return found
+
+    def extract(self, cleaned):
+        """Generic chunks, then every format occurrence with its confusions corrected"""
+        return list(self.candidates(cleaned))
+
+    def score(self, candidate, corrections=0):
+        """Score of a cleaned candidate: length, letter/digit mix and the format bonus, less its corrections"""
+        length = len(candidate)
+        if length < self.min_length:
+            return 0
+
+        score = 0
+        if 5 <= length <= 8:
+            score += 10
+        elif 4 <= length <= 9:
+            score += 5
+
+        # Cleaned candidates only hold letters and digits
+        has_letters = not candidate.isdigit()
+        has_numbers = not candidate.isalpha()
+        if has_letters and has_numbers:
+            score += 15
+        else:
+            score += 5
+
+        for plate_format in self.bonus_formats:
+            if plate_format.exact.match(candidate):
+                score += plate_format.bonus
+                break
+
+        return max(score - corrections * CORRECTION_PENALTY, 0)
+
+    def complete(self, candidate, score):
+        """True for a candidate that is exactly one of the formats as read, without corrections"""
+        if not candidate or score < self.score(candidate):
+            return False
+        return any(plate_format.exact.fullmatch(candidate) for plate_format in self.formats)
+
+    def read(self, text):
+        """Distinct (candidate, score) pairs of one OCR string, best first"""
+        if not text:
+            return []
+
+        scored = self._reads.get(text)
+        if scored is not None:
+            return scored
+
+        cleaned = self.clean(text)
+        if len(cleaned) < self.min_length:
+            scored = []
+        else:
+            candidates = {cleaned: 0, **self.candidates(cleaned)}
+            scored = [(c, self.score(c, n)) for c, n in candidates.items() if len(c) >= self.min_length]
+            scored.sort(key=lambda item: item[1], reverse=True)
+
+        if len(self._reads) >= self.max_cached_reads:
+            self._reads.clear()
+        self._reads[text] = scored
+        return scored
+
+    def best(self, texts):
+        """Best (candidate, score) over several OCR strings, (None, 0) without candidates"""
+        best_plate = None
+        best_score = 0
+        for text in texts:
+            scored = self.read(text)
+            if scored and scored[0][1] > best_score:
+                best_plate, best_score = scored[0]
+        return best_plate, best_score
+
+    def correct(self, plate):
+        """Fixes confusions of a plate that is exactly one of the formats, others are returned as is"""
+        if not plate:
+            return plate
+
+        for plate_format in self.formats:
+            if len(plate) == plate_format.length and plate_format.loose.fullmatch(plate):
+                if plate_format.corrections(plate) <= self.max_corrections:
+                    return plate_format.correct(plate)
+        return plate
@@ -0,0 +1,152 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+def legacy_preprocess(plate_img):
+    """The original preprocessing: filter, upscale by max(2, 300 // height) and threshold three ways"""
+    gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    filtered = cv2.bilateralFilter(blurred, 11, 17, 17)
+
+    height, width = filtered.shape
+    scale_factor = max(2, 300 // height)
+    resized = cv2.resize(filtered, None, fx=scale_factor, fy=scale_factor, interpolation=cv2.INTER_CUBIC)
+
+    thresh1 = cv2.adaptiveThreshold(resized, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    thresh2 = cv2.adaptiveThreshold(resized, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 11, 2)
+    _, thresh3 = cv2.threshold(resized, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    return [thresh1, thresh2, thresh3]
+
+
+class PlatePreprocessor:
+    """Plate preprocessing with a pixel budget.
+
+    Crops are brought to target_height (fewer rows if the width would push
+    them over max_pixels) instead of being upscaled by up to 30x. The
+    blur and bilateral filter run at the smaller of the crop and target
+    resolution, the plate is deskewed by the line through its characters,
+    and frame lines and background along the edges are trimmed.
+    The three threshold variants are computed from one shared resized
+    image, which lives in a per-thread buffer. The returned images are new
+    arrays; with reuse_buffers they are per-thread buffers as well, which
+    saves the allocations but only stays valid until the next call from
+    the same thread, so only callers that are done with them by then may
+    opt in.
+    """
+
+    def __init__(self, target_height=100, max_pixels=60000, max_skew=15.0, deskew=True, trim=True,
+                 reuse_buffers=False):
+        self.target_height = target_height
+        self.max_pixels = max_pixels
+        self.max_skew = max_skew
+        self.deskew = deskew
+        self.trim = trim
+        self.reuse_buffers = reuse_buffers
+        self._local = threading.local()
+
+    def _buffer(self, name, shape):
+        buffer = getattr(self._local, name, None)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+            setattr(self._local, name, buffer)
+        return buffer
+
+    def skew_angle(self, gray):
+        """Rotation of the text in degrees, 0 when it cannot be told or exceeds max_skew.
+
+        Dark blobs that do not touch the edges and are about as tall as a
+        character are taken as characters, and the angle is that of the line
+        through their centres.
+        """
+        _, dark = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        count, _, stats, centroids = cv2.connectedComponentsWithStats(dark, connectivity=8)
+
+        height, width = gray.shape
+        x, y, w, h = stats[1:, 0], stats[1:, 1], stats[1:, 2], stats[1:, 3]
+        inside = (x > 0) & (y > 0) & (x + w < width) & (y + h < height)
+        character = (h >= 0.25 * height) & (h <= 0.95 * height) & (w < 0.5 * width)
+        centres = centroids[1:][inside & character]
+        if len(centres) < 3:
+            return 0.0
+
+        slope = np.polyfit(centres[:, 0], centres[:, 1], 1)[0]
+        angle = float(np.degrees(np.arctan(slope)))
+        if abs(angle) < 0.5 or abs(angle) > self.max_skew:
+            return 0.0
+        return angle
+
+    def rotate(self, gray, angle):
+        height, width = gray.shape
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        return cv2.warpAffine(gray, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    def trim_borders(self, gray, max_fraction=0.15):
+        """Drops edge rows and columns that are mostly dark (plate frame, bumper, shadow)"""
+        _, dark = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        height, width = gray.shape
+        rows = dark.mean(axis=1)
+        cols = dark.mean(axis=0)
+
+        def span(fill, size):
+            limit = int(size * max_fraction)
+            start = 0
+            while start < limit and fill[start] > 0.6:
+                start += 1
+            end = size
+            while size - end < limit and fill[end - 1] > 0.6:
+                end -= 1
+            return start, end
+
+        top, bottom = span(rows, height)
+        left, right = span(cols, width)
+        return gray[top:bottom, left:right]
+
+    def output_size(self, height, width):
+        scale = self.target_height / height
+        if height * width * scale * scale > self.max_pixels:
+            scale = (self.max_pixels / (height * width)) ** 0.5
+        return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+    def __call__(self, plate_img):
+        gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY) if plate_img.ndim == 3 else plate_img
+
+        # Shrink large crops before filtering, small ones are filtered before upscaling
+        out_width, out_height = self.output_size(*gray.shape)
+        if out_height < gray.shape[0]:
+            gray = cv2.resize(gray, (out_width, out_height), interpolation=cv2.INTER_AREA)
+
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        filtered = cv2.bilateralFilter(blurred, 11, 17, 17)
+
+        if self.deskew:
+            angle = self.skew_angle(filtered)
+            if angle:
+                filtered = self.rotate(filtered, angle)
+        if self.trim:
+            filtered = self.trim_borders(filtered)
+
+        out_width, out_height = self.output_size(*filtered.shape)
+        # Tesseract reads better with a margin around the text
+        pad = max(2, out_height // 10)
+        resized = self._buffer("resized", (out_height + 2 * pad, out_width + 2 * pad))
+        inner = resized[pad:pad + out_height, pad:pad + out_width]
+        interpolation = cv2.INTER_AREA if out_height < filtered.shape[0] else cv2.INTER_CUBIC
+        cv2.resize(filtered, (out_width, out_height), dst=inner, interpolation=interpolation)
+        # Replicate the edges into the margin
+        resized[:pad, pad:pad + out_width] = inner[:1]
+        resized[pad + out_height:, pad:pad + out_width] = inner[-1:]
+        resized[:, :pad] = resized[:, pad:pad + 1]
+        resized[:, pad + out_width:] = resized[:, pad + out_width - 1:pad + out_width]
+
+        if self.reuse_buffers:
+            thresh1, thresh2, thresh3 = (self._buffer(f"thresh{i}", resized.shape) for i in range(1, 4))
+        else:
+            thresh1, thresh2, thresh3 = (np.empty(resized.shape, dtype=np.uint8) for _ in range(3))
+        cv2.adaptiveThreshold(resized, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2, dst=thresh1)
+        cv2.adaptiveThreshold(resized, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 11, 2, dst=thresh2)
+        cv2.threshold(resized, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=thresh3)
+
+        return [thresh1, thresh2, thresh3]
@@ -1,71 +1,117 @@
-import cv2
+import os
 import numpy as np
 import pytesseract
-import re
-from ultralytics import YOLO
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
+from ocr_engine import OCREngine
+from ocr_cascade import OCRCascadeStats
+from yolo_batcher import YOLOBatcher
+from detection_cache import NearDuplicateCache, dhash
+from plate_formats import PlateGrammar
+from plate_preprocess import PlatePreprocessor, legacy_preprocess
+from inference_backend import load_model
+from frame_decoder import PlateFrame
+from box_scheduler import BoxScheduler
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class PlateDetector:
-    def __init__(self, model_path: str, tesseract_path: str):
+    def __init__(self, model_path: str, tesseract_path: str, ocr_backend: str = "auto", ocr_pool_size: int = 2,
+                 cascade_score: int = None, cascade_stats_path: str = None,
+                 batch_size: int = None, batch_wait: float = 0.005,
+                 crop_cache_size: int = 0, cache_ttl: float = 30.0, cache_max_bytes: int = 4 * 1024 * 1024,
+                 crop_hash_size: int = 16, crop_hash_distance: int = 4, plate_formats: list = None,
+                 plate_height: int = None, plate_max_pixels: int = 60000,
+                 inference_backend: str = "ultralytics", inference_imgsz: int = 640, inference_int8: bool = False,
+                 detect_size: int = None, reduced_decode: bool = False,
+                 min_confidence: float = 0.0, min_plate_size: tuple = (0, 0), max_plates: int = None,
+                 ocr_time_budget: float = None):
         """Initialize the plate detector with model and tesseract paths"""
         self.tesseract_path = tesseract_path
         self.model = None
-        self.load_model(model_path)
-        self.setup_tesseract()
+        self.inference_backend = inference_backend
+        self.ready = False
+        # YOLO predictors are not thread-safe, OCR of the crops runs concurrently
+        self._model_lock = threading.Lock()
+        self.ocr = None
+        self.cascade = None
+        self.cascade_score = cascade_score
+        self.batcher = None
+        self.crop_cache = None
+        self.crop_hash_size = crop_hash_size
+        self.grammar = PlateGrammar(plate_formats)
+        self.detect_size = detect_size
+        self.reduced_decode = reduced_decode
+        self.scheduler = BoxScheduler(min_confidence, *min_plate_size, max_plates, ocr_time_budget)
+        self.preprocessor = PlatePreprocessor(plate_height, plate_max_pixels) if plate_height else None
+        self.load_model(model_path, inference_backend, inference_imgsz, inference_int8)
+        self.setup_tesseract(ocr_backend, ocr_pool_size)
+        if cascade_score is not None:
+            self.setup_cascade(cascade_score, cascade_stats_path)
+        if batch_size is not None and self.model is not None:
+            self.setup_batching(batch_size, batch_wait)
+        if crop_cache_size:
+            self.crop_cache = NearDuplicateCache(crop_cache_size, cache_ttl, cache_max_bytes, crop_hash_distance)
+        if self.model is not None:
+            self.warm_up(inference_imgsz)
     
-    def setup_tesseract(self):
-        """Setup Tesseract OCR path"""
+    def setup_tesseract(self, ocr_backend: str = "auto", ocr_pool_size: int = 2):
+        """Setup Tesseract OCR path and the OCR engine"""
         pytesseract.pytesseract.tesseract_cmd = self.tesseract_path
+        
+        # The bundled tessdata folder sits next to tesseract.exe
+        tessdata_path = os.path.join(os.path.dirname(self.tesseract_path), "tessdata")
+        self.ocr = OCREngine(
+            backend=ocr_backend,
+            pool_size=ocr_pool_size,
+            tessdata_path=tessdata_path if os.path.isdir(tessdata_path) else None,
+        )
         logger.info("Tesseract path configured")
     
-    def load_model(self, model_path: str):
-        """Load YOLO model"""
+    def setup_cascade(self, cascade_score: int, stats_path: str = None):
+        """Enable the early-exit OCR cascade over (threshold method, psm) combinations"""
+        self.cascade_score = cascade_score
+        # preprocess_plate_image returns three threshold images
+        combos = [(thresh_idx, psm) for thresh_idx in range(3) for psm in self.ocr.psm_modes]
+        self.cascade = OCRCascadeStats(combos, stats_path)
+        logger.info(f"OCR cascade enabled, stops at an exact format match scoring {cascade_score}+")
+    
+    def setup_batching(self, batch_size: int, batch_wait: float = 0.005):
+        """Batch the YOLO calls of concurrent detect_plate_number callers"""
+        self.batcher = YOLOBatcher(self.model, batch_size, batch_wait)
+    
+    def load_model(self, model_path: str, backend: str = "ultralytics", imgsz: int = 640, int8: bool = False):
+        """Load YOLO model, exported to ONNX on first use for the onnxruntime and openvino backends"""
         try:
-            self.model = YOLO(model_path)
-            logger.info("YOLO model loaded successfully")
+            self.model = load_model(model_path, backend, imgsz, int8)
+            logger.info(f"YOLO model loaded successfully ({backend})")
         except Exception as e:
             logger.error(f"Failed to load YOLO model: {e}")
             self.model = None
     
+    def warm_up(self, imgsz: int = 640):
+        """Run one inference on a blank frame so the first request does not pay for graph setup"""
+        try:
+            with self._model_lock:
+                self.model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8))
+            self.ready = True
+            logger.info("YOLO model warmed up")
+        except Exception as e:
+            logger.error(f"YOLO warm-up failed: {e}")
+    
     def preprocess_plate_image(self, plate_img):
-        """Enhanced preprocessing for better OCR accuracy"""
-        gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        filtered = cv2.bilateralFilter(blurred, 11, 17, 17)
-        
-        height, width = filtered.shape
-        scale_factor = max(2, 300 // height)
-        resized = cv2.resize(filtered, None, fx=scale_factor, fy=scale_factor, interpolation=cv2.INTER_CUBIC)
-        
-        # Try multiple thresholding methods
-        thresh1 = cv2.adaptiveThreshold(resized, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-        thresh2 = cv2.adaptiveThreshold(resized, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 11, 2)
-        _, thresh3 = cv2.threshold(resized, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        return [thresh1, thresh2, thresh3]
+        """Enhanced preprocessing for better OCR accuracy, three threshold variants of the crop"""
+        if self.preprocessor is not None:
+            return self.preprocessor(plate_img)
+        return legacy_preprocess(plate_img)
     
     def extract_text_multiple_configs(self, image):
-        """Try multiple OCR configurations"""
-        configs = [
-            r'--oem 3 --psm 8 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789',
-            r'--oem 3 --psm 7 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789',
-            r'--oem 3 --psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789',
-        ]
-        
-        results = []
-        for config in configs:
-            try:
-                text = pytesseract.image_to_string(image, config=config).strip()
-                results.append(text)
-            except Exception as e:
-                logger.warning(f"OCR config failed: {e}")
-                results.append("")
-        
-        return results
+        """Try multiple OCR configurations (psm 8, 7 and 6 with the plate whitelist)"""
+        return self.ocr.read_all(image)
     
     def clean_and_validate_text(self, text_list):
         """Clean and validate extracted text"""
@@ -73,129 +119,195 @@ class PlateDetector:
         for text in text_list:
             if not text:
                 continue
-            cleaned = re.sub(r'[^A-Z0-9\s]', '', text.upper())
-            cleaned = re.sub(r'\s+', '', cleaned).strip()
-            if len(cleaned) >= 4:  # Minimum plate length
+            cleaned = self.grammar.clean(text)
+            if len(cleaned) >= self.grammar.min_length:
                 cleaned_results.append(cleaned)
         return cleaned_results
     
     def detect_plate_patterns(self, text_list):
-        """Detect various license plate patterns"""
-        patterns = [
-            r'[A-Z]{2}\d{2}[A-Z]{3}',  # UK format
-            r'[A-Z]{3}\d{4}',          # US format
-            r'\d{3}[A-Z]{3}',          # Reverse US
-            r'[A-Z0-9]{5,8}',          # General 5-8 chars
-        ]
-        
+        """Detect the configured plate formats, OCR confusions corrected"""
         matches = []
         for text in text_list:
-            for pattern in patterns:
-                found = re.findall(pattern, text)
-                matches.extend(found)
-        
+            matches.extend(self.grammar.extract(text))
         return matches
     
     def score_plate_candidate(self, candidate):
         """Score plate candidates"""
-        if not candidate or len(candidate) < 4:
+        if not candidate:
             return 0
+        return self.grammar.score(candidate)
+
+    def correct_common_ocr_errors(self, plate: str) -> str:
+        """Apply common OCR misrecognition corrections based on expected plate formats."""
+        return self.grammar.correct(plate)
+
+    def read_plate(self, plate_crop, stats=None):
+        """OCR one plate crop, returns the best (candidate, score)"""
+        thresh_images = self.preprocess_plate_image(plate_crop)
         
-        score = 0
+        if self.cascade is not None:
+            return self.read_plate_cascade(thresh_images, stats)
         
-        # Length scoring
-        if 5 <= len(candidate) <= 8:
-            score += 10
-        elif 4 <= len(candidate) <= 9:
-            score += 5
+        texts = []
+        for thresh in thresh_images:
+            texts.extend(self.extract_text_multiple_configs(thresh))
         
-        # Check for letters and numbers
-        has_letters = bool(re.search(r'[A-Z]', candidate))
-        has_numbers = bool(re.search(r'\d', candidate))
+        if stats is not None:
+            stats["ocr_calls"] = stats.get("ocr_calls", 0) + len(thresh_images) * len(self.ocr.psm_modes)
         
-        if has_letters and has_numbers:
-            score += 15
-        elif has_letters or has_numbers:
-            score += 5
+        return self.grammar.best(texts)
+    
+    def read_plate_cached(self, plate_crop, stats=None):
+        """read_plate, skipped when a crop with a near identical perceptual hash was read recently"""
+        if self.crop_cache is None:
+            return self.read_plate(plate_crop, stats)
         
-        # Pattern bonuses
-        if re.match(r'[A-Z]{2}\d{2}[A-Z]{3}', candidate):  # UK format
-            score += 20
-        elif re.match(r'[A-Z]{3}\d{4}', candidate):  # US format
-            score += 15
+        # Crops are only compared with crops of about the same aspect ratio
+        key = (plate_crop.shape[1] * 4 // plate_crop.shape[0], dhash(plate_crop, self.crop_hash_size))
+        found, reading = self.crop_cache.get(key)
+        if found:
+            return reading
         
-        return score
-
-    def correct_common_ocr_errors(self, plate: str) -> str:
-        """Apply common OCR misrecognition corrections based on expected plate formats."""
-        if not plate:
-            return plate
-
-        corrected = list(plate)
-
-        # Positions 2 and 3 should be digits in UK format: AA00AAA
-        if len(plate) >= 4:
-            for idx in [2, 3]:
-                if corrected[idx] == 'G':
-                    corrected[idx] = '6'
-                elif corrected[idx] == 'O':
-                    corrected[idx] = '0'
-                elif corrected[idx] == 'I':
-                    corrected[idx] = '1'
-
-        return ''.join(corrected)
+        reading = self.read_plate(plate_crop, stats)
+        self.crop_cache.put(key, reading)
+        return reading
+    
+    def read_plate_cascade(self, thresh_images, stats=None):
+        """Try (threshold, psm) combinations by win rate, stop at an uncorrected exact format match scoring cascade_score+"""
+        best_plate = None
+        best_score = 0
+        winner = None
+        attempted = []
+        
+        for combo in self.cascade.order():
+            thresh_idx, psm = combo
+            try:
+                text = self.ocr.image_to_string(thresh_images[thresh_idx], psm)
+            except Exception as e:
+                logger.warning(f"OCR config failed: {e}")
+                text = ""
+            attempted.append(combo)
+            
+            candidate, score = self.grammar.best([text])
+            if score > best_score:
+                best_score = score
+                best_plate = candidate
+                winner = combo
+            
+            if best_score >= self.cascade_score and self.grammar.complete(best_plate, best_score):
+                break
+        
+        self.cascade.record(attempted, winner)
+        
+        if stats is not None:
+            stats["ocr_calls"] = stats.get("ocr_calls", 0) + len(attempted)
+        
+        return best_plate, best_score
 
-    def detect_plate_number(self, image):
-        """Main function to detect plate number from image"""
+    def detect_boxes(self, image):
+        """Run YOLO on one image, through the batcher when batching is enabled"""
+        if self.batcher is not None:
+            return self.batcher.predict(image)
+        
+        with self._model_lock:
+            return self.model(image)
+    
+    def detect_boxes_batch(self, images):
+        """Run YOLO on several images at once, returns one Results per image"""
+        if self.batcher is not None:
+            return self.batcher.predict_many(images)
+        
+        with self._model_lock:
+            return self.model(images)
+    
+    def crop_box(self, image, xyxy, padding=5):
+        """Crop of a YOLO box with some padding, clipped to the image"""
+        xmin, ymin, xmax, ymax = np.asarray(xyxy).astype(int)
+        
+        xmin = max(0, xmin - padding)
+        ymin = max(0, ymin - padding)
+        xmax = min(image.shape[1], xmax + padding)
+        ymax = min(image.shape[0], ymax + padding)
+        
+        return image[ymin:ymax, xmin:xmax]
+    
+    def prepare_frame(self, image):
+        """PlateFrame of a BGR array or encoded image bytes, None if the bytes cannot be decoded
+        
+        YOLO gets the image downscaled to detect_size, the plate crops are cut from full resolution.
+        """
+        if isinstance(image, PlateFrame):
+            return image
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return PlateFrame.from_bytes(image, self.detect_size, self.reduced_decode)
+        return PlateFrame.from_array(image, self.detect_size)
+    
+    def read_boxes(self, frame, results, stats=None):
+        """OCR the boxes YOLO found in the frame, returns the best (plate, score) of each box read
+        
+        The scheduler filters and orders the boxes. When the OCR time budget runs out
+        the remaining boxes are skipped and stats["budget_exhausted"] is set.
+        """
+        frame = self.prepare_frame(frame)
+        readings = []
+        
+        boxes = self.scheduler.rank(frame, results)
+        deadline = self.scheduler.deadline()
+        
+        for i, xyxy in enumerate(boxes):
+            if i and self.scheduler.expired(deadline):
+                logger.warning(f"OCR time budget used up, {len(boxes) - i} of {len(boxes)} plate boxes not read")
+                if stats is not None:
+                    stats["budget_exhausted"] = True
+                break
+            
+            plate_crop = self.crop_box(frame.full, xyxy)
+            
+            if plate_crop.size == 0:
+                continue
+            
+            plate, score = self.read_plate_cached(plate_crop, stats)
+            if plate:
+                readings.append((plate, score))
+        
+        return readings
+    
+    def best_reading(self, readings):
+        """Corrected plate of the highest scoring reading, with its score"""
+        best_plate = None
+        best_score = 0
+        for plate, score in readings:
+            if score > best_score:
+                best_score = score
+                best_plate = plate
+        
+        if best_plate:
+            best_plate = self.correct_common_ocr_errors(best_plate)
+        
+        return best_plate, best_score
+    
+    def vote_plates(self, plates):
+        """Plate with the highest summed score_plate_candidate over all reads, None without reads"""
+        votes = {}
+        for plate in plates:
+            votes[plate] = votes.get(plate, 0) + self.score_plate_candidate(plate)
+        
+        return max(votes, key=votes.get) if votes else None
+    
+    def detect_plate_number(self, image, stats=None):
+        """Main function to detect plate number from image
+        
+        image is a BGR array or a PlateFrame from prepare_frame. If a stats dict is given,
+        the number of OCR calls made is added to stats["ocr_calls"].
+        """
         if self.model is None:
             logger.error("Model not loaded")
             return None
         
         try:
-            results = self.model(image)
-            
-            best_plate = None
-            best_score = 0
-            
-            for r in results:
-                boxes = r.boxes
-                if boxes is None:
-                    continue
-                    
-                for box in boxes:
-                    xyxy = box.xyxy[0].cpu().numpy().astype(int)
-                    xmin, ymin, xmax, ymax = xyxy
-                    
-                    padding = 5
-                    xmin = max(0, xmin - padding)
-                    ymin = max(0, ymin - padding)
-                    xmax = min(image.shape[1], xmax + padding)
-                    ymax = min(image.shape[0], ymax + padding)
-                    
-                    plate_crop = image[ymin:ymax, xmin:xmax]
-                    
-                    if plate_crop.size == 0:
-                        continue
-                    
-                    thresh_images = self.preprocess_plate_image(plate_crop)
-                    all_candidates = []
-                    
-                    for thresh in thresh_images:
-                        text_results = self.extract_text_multiple_configs(thresh)
-                        cleaned_texts = self.clean_and_validate_text(text_results)
-                        patterns = self.detect_plate_patterns(cleaned_texts)
-                        all_candidates.extend(cleaned_texts + patterns)
-                    
-                    all_candidates = list(set([c for c in all_candidates if c and len(c) >= 4]))
-                    
-                    for candidate in all_candidates:
-                        score = self.score_plate_candidate(candidate)
-                        if score > best_score:
-                            best_score = score
-                            best_plate = candidate
-            
-            if best_plate:
-                best_plate = self.correct_common_ocr_errors(best_plate)
+            frame = self.prepare_frame(image)
+            results = self.detect_boxes(frame.detection)
+            best_plate, best_score = self.best_reading(self.read_boxes(frame, results, stats))
             
             logger.info(f"Best plate detected (after correction): {best_plate} (score: {best_score})")
             return best_plate
@@ -203,7 +315,74 @@ class PlateDetector:
         except Exception as e:
             logger.error(f"Error in plate detection: {e}")
             return None
+    
+    def decode_images(self, images):
+        """PlateFrames of the images, encoded bytes decoded in parallel, None where decoding fails"""
+        images = list(images)
+        encoded = [i for i, image in enumerate(images) if isinstance(image, (bytes, bytearray, memoryview))]
+        
+        if encoded:
+            # cv2.imdecode releases the GIL
+            with ThreadPoolExecutor(max_workers=min(len(encoded), 8)) as pool:
+                for i, frame in zip(encoded, pool.map(self.prepare_frame, [images[i] for i in encoded])):
+                    images[i] = frame
+        
+        return [self.prepare_frame(image) if image is not None else None for image in images]
+    
+    def detect_plate_numbers(self, images, stats=None, consensus=False):
+        """Detect plate numbers in several images, e.g. a burst of frames of one car
+        
+        Images may be BGR arrays or encoded image bytes, and all of them go through
+        YOLO together. Returns {"plates": [...], "consensus": ...} where plates holds
+        one plate per image (None when undecodable or nothing was read). With
+        consensus=True every frame votes for each plate it read, weighted by
+        score_plate_candidate, and the plate with most votes is the consensus.
+        """
+        output = {"plates": [None] * len(images), "consensus": None}
+        
+        if self.model is None:
+            logger.error("Model not loaded")
+            return output
+        
+        images = self.decode_images(images)
+        valid = [i for i, image in enumerate(images) if image is not None]
+        if len(valid) < len(images):
+            logger.warning(f"Could not decode {len(images) - len(valid)} of {len(images)} images")
+        if not valid:
+            return output
+        
+        try:
+            results = self.detect_boxes_batch([images[i].detection for i in valid])
+        except Exception as e:
+            logger.error(f"Error in plate detection: {e}")
+            return output
+        
+        voted = []
+        for i, result in zip(valid, results):
+            try:
+                readings = self.read_boxes(images[i], [result], stats)
+            except Exception as e:
+                logger.error(f"Error reading plates of image {i}: {e}")
+                continue
+            
+            output["plates"][i], _ = self.best_reading(readings)
+            
+            # One vote per distinct plate per frame
+            voted.extend(dict.fromkeys(self.correct_common_ocr_errors(plate) for plate, _ in readings))
+        
+        if consensus:
+            output["consensus"] = self.vote_plates(voted)
+        
+        logger.info(f"Plates detected in {len(images)} images: {output['plates']} (consensus: {output['consensus']})")
+        return output
 
     def is_model_loaded(self):
         """Check if model is loaded"""
         return self.model is not None
+
+    def close(self):
+        """Stop the batcher and release the OCR handles"""
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+        self.ocr.close()
@@ -0,0 +1,249 @@
+import csv
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+
+from plate_formats import DEFAULT_CONFUSIONS
+
+logger = logging.getLogger(__name__)
+
+# Edit costs: swapping characters OCR confuses (O/0, B/8, ...) costs 1, any
+# other substitution, insertion or deletion costs 2
+CONFUSION_COST = 1
+EDIT_COST = 2
+
+# Canonical forms are packed base 37 into an int64, which holds 12 characters
+MAX_LENGTH = 12
+_BASE = 37
+_POWERS = _BASE ** np.arange(MAX_LENGTH - 1, -1, -1, dtype=np.int64)
+_SYMBOLS = np.zeros(256, dtype=np.int64)
+for _i, _char in enumerate("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ", 1):
+    _SYMBOLS[ord(_char)] = _i
+
+
+class PlateRegistry:
+    """Registered plates with a fuzzy lookup that tolerates OCR mistakes.
+
+    The distance is an edit distance where substituting one character of
+    a confusion pair for the other costs CONFUSION_COST and every other
+    edit EDIT_COST. Plates are indexed by their canonical form, where each
+    confusion pair collapses to one symbol, and by every canonical form
+    with one character deleted (symmetric delete), so a lookup is a
+    handful of binary searches instead of a scan. That finds every plate
+    within one real edit plus any number of confusions, which is exact for
+    max_distance up to 3.
+
+    The index is kept as a sorted int64 array of packed keys. Added plates
+    go to a small pending dict that is merged into the arrays every
+    merge_every keys, removed plates are dropped from the results and
+    purged at the next merge.
+    """
+
+    def __init__(self, confusions=None, merge_every=4096):
+        confusions = DEFAULT_CONFUSIONS if confusions is None else confusions
+        self._canonical = str.maketrans(confusions)
+        self._confusable = {frozenset(pair) for pair in confusions.items()}
+        self._non_plate = re.compile(r"[^A-Z0-9]")
+        self.merge_every = merge_every
+
+        self._lock = threading.Lock()
+        self._ids = {}  # plate -> id
+        self._plates = []  # id -> plate, None once removed
+        self._info = {}  # plate -> registration details
+        self._keys = np.empty(0, dtype=np.int64)
+        self._key_ids = np.empty(0, dtype=np.int32)
+        self._pending = {}  # key -> [ids] not merged yet
+        self._pending_count = 0
+        self._removed = 0
+        self.lookups = 0
+        self.matches = 0
+
+    def normalize(self, plate):
+        """Upper case letters and digits only"""
+        return self._non_plate.sub("", str(plate).upper())
+
+    def canonical(self, plate):
+        return plate.translate(self._canonical)
+
+    def distance(self, a, b):
+        """Confusion-weighted edit distance of two normalized plates"""
+        previous = [j * EDIT_COST for j in range(len(b) + 1)]
+        for i, char_a in enumerate(a, 1):
+            current = [i * EDIT_COST]
+            for j, char_b in enumerate(b, 1):
+                if char_a == char_b:
+                    substitution = 0
+                elif frozenset((char_a, char_b)) in self._confusable:
+                    substitution = CONFUSION_COST
+                else:
+                    substitution = EDIT_COST
+                current.append(min(previous[j] + EDIT_COST, current[j - 1] + EDIT_COST,
+                                   previous[j - 1] + substitution))
+            previous = current
+        return previous[-1]
+
+    def _encode(self, canonicals):
+        """(n, MAX_LENGTH) symbol array of canonical plates, zero padded"""
+        joined = "".join(plate.ljust(MAX_LENGTH, "\0") for plate in canonicals).encode("ascii")
+        return _SYMBOLS[np.frombuffer(joined, dtype=np.uint8)].reshape(-1, MAX_LENGTH)
+
+    def _variant_keys(self, symbols, lengths):
+        """Packed keys of each plate and of each plate with one character deleted, with row indices"""
+        rows = np.arange(len(symbols))
+        keys = [symbols @ _POWERS]
+        owners = [rows]
+        padding = np.zeros((len(symbols), 1), dtype=np.int64)
+        for position in range(MAX_LENGTH):
+            valid = lengths > position
+            if not valid.any():
+                break
+            deleted = np.hstack([symbols[:, :position], symbols[:, position + 1:], padding])
+            keys.append((deleted @ _POWERS)[valid])
+            owners.append(rows[valid])
+        return np.concatenate(keys), np.concatenate(owners)
+
+    def add_many(self, plates):
+        """Registers plates (with optional details as (plate, info) pairs), returns how many are new"""
+        new = []
+        with self._lock:
+            for item in plates:
+                plate, info = item if isinstance(item, tuple) else (item, None)
+                plate = self.normalize(plate)
+                if not plate or len(plate) > MAX_LENGTH:
+                    continue
+                self._info[plate] = info
+                if plate not in self._ids:
+                    self._ids[plate] = len(self._plates)
+                    self._plates.append(plate)
+                    new.append(plate)
+
+            if not new:
+                return 0
+
+            symbols = self._encode([self.canonical(plate) for plate in new])
+            keys, rows = self._variant_keys(symbols, np.array([len(plate) for plate in new]))
+            ids = np.array([self._ids[plate] for plate in new], dtype=np.int32)[rows]
+
+            if len(keys) >= self.merge_every:
+                self._merge(keys, ids)
+            else:
+                for key, plate_id in zip(keys.tolist(), ids.tolist()):
+                    self._pending.setdefault(key, []).append(plate_id)
+                self._pending_count += len(keys)
+                if self._pending_count >= self.merge_every:
+                    self._merge()
+        return len(new)
+
+    def add(self, plate, info=None):
+        return self.add_many([(plate, info)]) == 1
+
+    def remove(self, plate):
+        """Unregisters a plate, False if it was not registered"""
+        plate = self.normalize(plate)
+        with self._lock:
+            plate_id = self._ids.pop(plate, None)
+            if plate_id is None:
+                return False
+            self._plates[plate_id] = None
+            self._info.pop(plate, None)
+            self._removed += 1
+            if self._removed >= self.merge_every:
+                self._merge()
+        return True
+
+    def _merge(self, keys=None, ids=None):
+        """Folds the pending keys (and the given ones) into the sorted arrays, dropping removed plates"""
+        parts_keys = [self._keys]
+        parts_ids = [self._key_ids]
+        if self._pending:
+            parts_keys.append(np.fromiter(
+                (key for key, plate_ids in self._pending.items() for _ in plate_ids), dtype=np.int64))
+            parts_ids.append(np.fromiter(
+                (plate_id for plate_ids in self._pending.values() for plate_id in plate_ids), dtype=np.int32))
+        if keys is not None:
+            parts_keys.append(keys)
+            parts_ids.append(ids)
+
+        keys = np.concatenate(parts_keys)
+        ids = np.concatenate(parts_ids)
+        if self._removed:
+            alive = np.fromiter((plate is not None for plate in self._plates), dtype=bool, count=len(self._plates))
+            keys, ids = keys[alive[ids]], ids[alive[ids]]
+
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._key_ids = keys[order], ids[order]
+        self._pending = {}
+        self._pending_count = 0
+        self._removed = 0
+
+    def load_csv(self, path, column="plate"):
+        """Registers the plates of a CSV file with a header row, the other columns become their details"""
+        start = time.perf_counter()
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = [(row.pop(column), row) for row in csv.DictReader(f) if row.get(column)]
+        added = self.add_many(rows)
+        logger.info(f"Loaded {added} registered plates from {path} in {time.perf_counter() - start:.2f}s")
+        return added
+
+    def candidates(self, plate, max_distance=2):
+        """Ids of the registered plates that may lie within max_distance of a normalized plate"""
+        canonical = self.canonical(plate)
+        symbols = self._encode([canonical])
+        if max_distance < EDIT_COST:
+            keys = symbols @ _POWERS
+        else:
+            keys, _ = self._variant_keys(symbols, np.array([len(canonical)]))
+
+        found = set()
+        left = np.searchsorted(self._keys, keys, side="left")
+        right = np.searchsorted(self._keys, keys, side="right")
+        for start, end in zip(left.tolist(), right.tolist()):
+            found.update(self._key_ids[start:end].tolist())
+        for key in keys.tolist():
+            found.update(self._pending.get(key, ()))
+        return found
+
+    def match(self, plate, max_distance=2):
+        """Closest registered plate within max_distance as (plate, distance), (None, None) without one"""
+        plate = self.normalize(plate or "")
+        if not plate or len(plate) > MAX_LENGTH:
+            return None, None
+
+        best, best_distance = None, None
+        with self._lock:
+            self.lookups += 1
+            if plate in self._ids:
+                self.matches += 1
+                return plate, 0
+
+            for plate_id in self.candidates(plate, max_distance):
+                registered = self._plates[plate_id]
+                if registered is None:
+                    continue
+                distance = self.distance(plate, registered)
+                if distance <= max_distance and (best_distance is None or distance < best_distance):
+                    best, best_distance = registered, distance
+
+            if best is not None:
+                self.matches += 1
+        return best, best_distance
+
+    def details(self, plate):
+        return self._info.get(self.normalize(plate))
+
+    def __contains__(self, plate):
+        return self.normalize(plate) in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def snapshot(self):
+        return {
+            "plates": len(self._ids),
+            "index_keys": len(self._keys) + self._pending_count,
+            "lookups": self.lookups,
+            "matches": self.matches,
+        }
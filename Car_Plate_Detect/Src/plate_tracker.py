@@ -0,0 +1,226 @@
+import cv2
+import numpy as np
+
+
+def box_iou(box, boxes):
+    """IoU of one xyxy box with every row of an (n, 4) xyxy array"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-6)
+
+
+def crop_quality(crop):
+    """Sharpness (variance of the Laplacian) times area, higher is a better crop to OCR"""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    return cv2.Laplacian(gray, cv2.CV_64F).var() * gray.shape[0] * gray.shape[1]
+
+
+def result_boxes(results, min_confidence=0.0):
+    """(n, 4) xyxy array of the YOLO boxes with at least min_confidence"""
+    boxes = []
+    for r in results:
+        if r.boxes is None:
+            continue
+        for box in r.boxes:
+            if float(box.conf[0]) >= min_confidence:
+                boxes.append(box.xyxy[0].cpu().numpy())
+    return np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+class PlateTrack:
+    """One plate followed across frames, with the crop to OCR next and the reads so far."""
+
+    def __init__(self, track_id, box, frame_nmr):
+        self.id = track_id
+        self.box = box
+        self.first_frame = frame_nmr
+        self.last_frame = frame_nmr
+        self.hits = 1
+        self.missed = 0
+
+        # Best crop seen since the last OCR read
+        self.best_crop = None
+        self.best_quality = 0.0
+        # Quality of the best crop read so far
+        self.read_quality = 0.0
+        self.last_read_frame = None
+        self.ocr_reads = 0
+        self.reads = []
+        self.emitted = False
+
+    def add_crop(self, crop):
+        quality = crop_quality(crop)
+        if quality > self.best_quality:
+            self.best_crop = crop.copy()
+            self.best_quality = quality
+
+
+class PlateTracker:
+    """Links YOLO plate boxes across video frames and reads each plate a few times.
+
+    Boxes are matched to tracks greedily by IoU, falling back to the distance
+    between centres for fast moving cars. A track is OCR'd once it was seen
+    in min_hits frames, and again at most every read_interval frames when a
+    crop turns up that is sharper or larger by the improvement factor, up to
+    max_reads times. One event per track is emitted as soon as agree reads
+    match, or with the vote over all reads once max_reads is reached or the
+    track is lost.
+    """
+
+    def __init__(self, detector, iou_threshold=0.3, centroid_factor=0.5, max_missed=10, min_hits=3,
+                 max_reads=3, read_interval=5, improvement=1.25, agree=2):
+        self.detector = detector
+        self.iou_threshold = iou_threshold
+        self.centroid_factor = centroid_factor
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self.max_reads = max_reads
+        self.read_interval = read_interval
+        self.improvement = improvement
+        self.agree = agree
+
+        self.tracks = []
+        self.next_id = 0
+        self.frames = 0
+        self.ocr_reads = 0
+
+    def _match(self, boxes):
+        """Greedy (track index, box index) pairs, by IoU then by centre distance"""
+        pairs = []
+        free_tracks = set(range(len(self.tracks)))
+        free_boxes = set(range(len(boxes)))
+        if not self.tracks or not len(boxes):
+            return pairs, free_tracks, free_boxes
+
+        track_boxes = np.array([track.box for track in self.tracks], dtype=np.float32)
+        iou = np.array([box_iou(box, boxes) for box in track_boxes])
+        for flat in np.argsort(-iou, axis=None):
+            t, b = np.unravel_index(flat, iou.shape)
+            if iou[t, b] < self.iou_threshold:
+                break
+            if t in free_tracks and b in free_boxes:
+                pairs.append((t, b))
+                free_tracks.discard(t)
+                free_boxes.discard(b)
+
+        if free_tracks and free_boxes:
+            track_centres = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2
+            centres = (boxes[:, :2] + boxes[:, 2:]) / 2
+            distance = np.linalg.norm(track_centres[:, None] - centres[None], axis=2)
+            # A box may move by a fraction of the track's box width between frames
+            limit = (track_boxes[:, 2] - track_boxes[:, 0]) * self.centroid_factor
+            for flat in np.argsort(distance, axis=None):
+                t, b = np.unravel_index(flat, distance.shape)
+                if t in free_tracks and b in free_boxes and distance[t, b] <= limit[t]:
+                    pairs.append((t, b))
+                    free_tracks.discard(t)
+                    free_boxes.discard(b)
+
+        return pairs, free_tracks, free_boxes
+
+    def _read(self, track, frame_nmr, stats=None):
+        plate, _ = self.detector.read_plate(track.best_crop, stats)
+        if plate:
+            track.reads.append(self.detector.correct_common_ocr_errors(plate))
+
+        track.ocr_reads += 1
+        self.ocr_reads += 1
+        track.read_quality = max(track.read_quality, track.best_quality)
+        track.last_read_frame = frame_nmr
+        track.best_crop = None
+        track.best_quality = 0.0
+
+    def _should_read(self, track, frame_nmr):
+        if track.emitted or track.best_crop is None or track.ocr_reads >= self.max_reads:
+            return False
+        if track.hits < self.min_hits:
+            return False
+        if track.last_read_frame is None:
+            return True
+        return (frame_nmr - track.last_read_frame >= self.read_interval
+                and track.best_quality > track.read_quality * self.improvement)
+
+    def _event(self, track, final):
+        """Plate event for the track if its reads settle the plate, None otherwise"""
+        if track.emitted or not track.reads:
+            return None
+
+        plate = self.detector.vote_plates(track.reads)
+        if not final and track.reads.count(plate) < self.agree and track.ocr_reads < self.max_reads:
+            return None
+
+        track.emitted = True
+        return {
+            "type": "plate",
+            "track": track.id,
+            "plate": plate,
+            "reads": list(track.reads),
+            "ocr_reads": track.ocr_reads,
+            "first_frame": track.first_frame,
+            "last_frame": track.last_frame,
+        }
+
+    def _finish(self, track, stats=None):
+        if not track.emitted and not track.reads and track.best_crop is not None and track.hits >= self.min_hits:
+            # Lost before it was read, give it one read on its best crop
+            self._read(track, track.last_frame, stats)
+        return self._event(track, final=True)
+
+    def update(self, frame, boxes, frame_nmr, stats=None):
+        """Adds the plate boxes of one frame, returns the plate events this frame settled"""
+        self.frames += 1
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        pairs, free_tracks, free_boxes = self._match(boxes)
+
+        for t, b in pairs:
+            track = self.tracks[t]
+            track.box = boxes[b]
+            track.last_frame = frame_nmr
+            track.hits += 1
+            track.missed = 0
+            if not track.emitted:
+                crop = self.detector.crop_box(frame, boxes[b])
+                if crop.size:
+                    track.add_crop(crop)
+
+        events = []
+        kept = []
+        for t, track in enumerate(self.tracks):
+            if t in free_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    event = self._finish(track, stats)
+                    if event is not None:
+                        events.append(event)
+                    continue
+            kept.append(track)
+        self.tracks = kept
+
+        for b in sorted(free_boxes):
+            track = PlateTrack(self.next_id, boxes[b], frame_nmr)
+            self.next_id += 1
+            crop = self.detector.crop_box(frame, boxes[b])
+            if crop.size:
+                track.add_crop(crop)
+            self.tracks.append(track)
+
+        for track in self.tracks:
+            if self._should_read(track, frame_nmr):
+                self._read(track, frame_nmr, stats)
+                event = self._event(track, final=False)
+                if event is not None:
+                    events.append(event)
+
+        return events
+
+    def finish(self, stats=None):
+        """Ends every open track, e.g. at the end of a video, returns their plate events"""
+        events = [self._finish(track, stats) for track in self.tracks]
+        self.tracks = []
+        return [event for event in events if event is not None]
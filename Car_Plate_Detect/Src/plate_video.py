@@ -0,0 +1,106 @@
+import argparse
+import json
+import sys
+import time
+
+import cv2
+
+from plate_processor import PlateDetector
+from plate_tracker import PlateTracker, result_boxes
+from config import (
+    MODEL_PATH, TESSERACT_PATH, OCR_BACKEND, OCR_POOL_SIZE, CONFIDENCE_THRESHOLD, PLATE_FORMATS,
+    PLATE_TARGET_HEIGHT, PLATE_MAX_PIXELS, INFERENCE_BACKEND, INFERENCE_IMGSZ, INFERENCE_INT8,
+    DETECT_IMAGE_SIZE,
+)
+
+
+def draw_tracks(frame, tracker):
+    for track in tracker.tracks:
+        if track.missed:
+            continue
+        x1, y1, x2, y2 = track.box.astype(int)
+        color = (0, 255, 0) if track.emitted else (0, 165, 255)
+        label = f"#{track.id} {track.reads[-1] if track.reads else ''}"
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame, label, (x1, max(y1 - 8, 15)), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+    return frame
+
+
+def run(cap, detector, tracker, stream, min_confidence=CONFIDENCE_THRESHOLD, show=False, start_time=0.0, live=False):
+    """Tracks the plates of a gate video and writes one JSON Lines plate event per vehicle.
+
+    YOLO runs on every frame, OCR only on the few crops the tracker picks.
+    Timestamps are start_time plus the position in the video for files, and
+    the wall clock for live cameras.
+    """
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    stats = {"ocr_calls": 0}
+    frame_nmr = 0
+
+    def write(events, frame_nmr):
+        timestamp = time.time() if live else start_time + frame_nmr / fps
+        for event in events:
+            event["timestamp"] = round(timestamp, 3)
+            stream.write(json.dumps(event) + "\n")
+        if events:
+            stream.flush()
+
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        # Detect on the downscaled frame, the tracker crops plates from the full one
+        plate_frame = detector.prepare_frame(frame)
+        boxes = plate_frame.to_full(result_boxes(detector.detect_boxes(plate_frame.detection), min_confidence))
+        write(tracker.update(frame, boxes, frame_nmr, stats), frame_nmr)
+
+        if show:
+            cv2.imshow("Plate Tracking", draw_tracks(frame, tracker))
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+
+        frame_nmr += 1
+
+    write(tracker.finish(stats), max(frame_nmr - 1, 0))
+
+    print(f"{frame_nmr} frames, {tracker.next_id} tracks, {tracker.ocr_reads} crops read "
+          f"with {stats['ocr_calls']} OCR calls", file=sys.stderr)
+    return frame_nmr
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write one plate event per vehicle of a gate video or camera")
+    parser.add_argument("--video", default="0", help="video file, or a camera index")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--tesseract", default=TESSERACT_PATH)
+    parser.add_argument("--backend", default=INFERENCE_BACKEND, choices=["ultralytics", "onnxruntime", "openvino"])
+    parser.add_argument("--output", default="-", help="events file, - for stdout")
+    parser.add_argument("--min-confidence", type=float, default=CONFIDENCE_THRESHOLD)
+    parser.add_argument("--max-reads", type=int, default=3, help="OCR reads per vehicle at most")
+    parser.add_argument("--agree", type=int, default=2, help="matching reads that settle a plate early")
+    parser.add_argument("--max-missed", type=int, default=10, help="frames a plate may go undetected")
+    parser.add_argument("--start-time", type=float, default=0.0,
+                        help="unix time of the first frame of a recorded video")
+    parser.add_argument("--show", action="store_true", help="show the tracked plates")
+    args = parser.parse_args()
+
+    detector = PlateDetector(args.model, args.tesseract, OCR_BACKEND, OCR_POOL_SIZE, plate_formats=PLATE_FORMATS,
+                             plate_height=PLATE_TARGET_HEIGHT, plate_max_pixels=PLATE_MAX_PIXELS,
+                             inference_backend=args.backend, inference_imgsz=INFERENCE_IMGSZ,
+                             inference_int8=INFERENCE_INT8, detect_size=DETECT_IMAGE_SIZE)
+    tracker = PlateTracker(detector, max_missed=args.max_missed, max_reads=args.max_reads, agree=args.agree)
+    cap = cv2.VideoCapture(int(args.video) if args.video.isdigit() else args.video)
+
+    stream = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        run(cap, detector, tracker, stream, args.min_confidence, args.show, args.start_time,
+            live=args.video.isdigit())
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+        cap.release()
+        detector.close()
+        if args.show:
+            cv2.destroyAllWindows()
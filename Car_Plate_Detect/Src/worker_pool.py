@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class PoolFullError(Exception):
+    """Every worker is busy and the wait queue is full"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Detection queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """The request ran out of time before a worker finished it"""
+
+
+# Detector of the current worker process, only set in process mode
+_worker_detector = None
+
+
+def _init_process_worker(detector_args, detector_kwargs):
+    global _worker_detector
+    from plate_processor import PlateDetector
+    _worker_detector = PlateDetector(*detector_args, **detector_kwargs)
+
+
+def _run_detection(deadline, detector, contents):
+    """Decode and detect one uploaded image, skipped if the deadline already passed"""
+    if time.time() > deadline:
+        raise DeadlineExceededError("Request expired while queued")
+
+    start = time.perf_counter()
+    # detector is None in process mode, each worker process has its own
+    detector = detector if detector is not None else _worker_detector
+    frame = detector.prepare_frame(contents)
+    if frame is None:
+        raise ValueError("Could not decode image")
+
+    stats = {"ocr_calls": 0}
+    plate_number = detector.detect_plate_number(frame, stats)
+    stats["detect_time"] = time.perf_counter() - start
+    return plate_number, stats
+
+
+def _worker_info(detector):
+    """What /health and /info report about a worker's detector"""
+    detector = detector if detector is not None else _worker_detector
+    return {
+        "ready": detector.ready,
+        "model_loaded": detector.is_model_loaded(),
+        "inference_backend": detector.inference_backend,
+        "ocr_backend": detector.ocr.backend,
+        "cascade_combos": detector.cascade.combos if detector.cascade is not None else None,
+    }
+
+
+def _run_batch_detection(deadline, detector, contents_list, consensus=False):
+    """Detect plates in several uploaded images, skipped if the deadline already passed"""
+    if time.time() > deadline:
+        raise DeadlineExceededError("Request expired while queued")
+
+    start = time.perf_counter()
+    detector = detector if detector is not None else _worker_detector
+    stats = {"ocr_calls": 0}
+    output = detector.detect_plate_numbers(contents_list, stats, consensus)
+    stats["detect_time"] = time.perf_counter() - start
+    return output, stats
+
+
+class DetectionPool:
+    """Runs plate detection off the event loop with admission control.
+
+    At most workers + queue_size requests are admitted at once, later ones
+    are rejected straight away with PoolFullError. Every admitted request
+    gets a deadline: a worker skips requests that expired while queued, and
+    the caller stops waiting once the deadline passes.
+
+    In "thread" mode the workers share the given detector. In "process"
+    mode each worker process builds its own PlateDetector from
+    detector_args/detector_kwargs, which sidesteps the GIL for the Python
+    parts of preprocessing at the cost of one model copy per worker.
+    """
+
+    def __init__(self, detector=None, mode="thread", workers=2, queue_size=8, timeout=10.0,
+                 detector_args=(), detector_kwargs=None):
+        self.detector = detector
+        self.mode = mode
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+
+        if mode == "process":
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_process_worker,
+                initargs=(tuple(detector_args), dict(detector_kwargs or {})),
+            )
+        elif mode == "thread":
+            if detector is None:
+                raise ValueError("Thread mode needs a detector")
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="detect")
+        else:
+            raise ValueError(f"Unknown worker pool mode: {mode}")
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._service_time = None
+        # expired: dropped before a worker started them, timed_out: answered with a timeout
+        self.counts = {"completed": 0, "failed": 0, "rejected": 0, "expired": 0, "timed_out": 0}
+
+        logger.info(f"Detection pool: {workers} {mode} workers, queue {queue_size}, timeout {timeout}s")
+
+    def retry_after(self):
+        """Seconds until a queued slot is likely to free up, from the average service time"""
+        service_time = self._service_time or 1.0
+        return max(1, math.ceil(service_time * (self._pending - self.workers + 1) / self.workers))
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled():
+                self.counts["expired"] += 1
+                return
+
+            if future.exception() is None:
+                self.counts["completed"] += 1
+                elapsed = future.result()[1]["detect_time"]
+                # Moving average, used for Retry-After
+                self._service_time = elapsed if self._service_time is None else 0.8 * self._service_time + 0.2 * elapsed
+            elif isinstance(future.exception(), DeadlineExceededError):
+                self.counts["expired"] += 1
+            else:
+                self.counts["failed"] += 1
+
+    async def detect(self, contents, timeout=None):
+        """Returns (plate_number, stats) for the encoded image bytes"""
+        return await self._submit(_run_detection, contents, timeout=timeout)
+
+    async def detect_batch(self, contents_list, consensus=False, timeout=None):
+        """Returns (detect_plate_numbers output, stats), the batch takes a single slot"""
+        return await self._submit(_run_batch_detection, contents_list, consensus, timeout=timeout)
+
+    async def _submit(self, fn, *args, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                self.counts["rejected"] += 1
+                raise PoolFullError(self.retry_after())
+            self._pending += 1
+
+        deadline = time.time() + timeout
+        detector = self.detector if self.mode == "thread" else None
+        try:
+            future = self.executor.submit(fn, deadline, detector, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            # Cancels the job if no worker has picked it up yet
+            future.cancel()
+            with self._lock:
+                self.counts["timed_out"] += 1
+            raise DeadlineExceededError(f"Detection did not finish within {timeout}s")
+
+    def worker_info(self):
+        """Waits until a worker has its detector and returns what it reports about it"""
+        detector = self.detector if self.mode == "thread" else None
+        return self.executor.submit(_worker_info, detector).result()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "timeout": self.timeout,
+                "pending": self._pending,
+                "avg_service_time": round(self._service_time, 4) if self._service_time is not None else None,
+                **self.counts,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,132 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class YOLOBatcher:
+    """Collects images from concurrent callers into batched YOLO calls.
+
+    The first image of a batch waits at most max_wait seconds for others
+    to join, or less if max_batch_size images arrive sooner. A single
+    dispatcher thread makes every model call, so the model is never used
+    from two threads at once.
+    """
+
+    def __init__(self, model, max_batch_size=4, max_wait=0.005):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.images = 0
+        self.queue_time = 0.0
+        self.max_queue_time = 0.0
+        self.inference_time = 0.0
+
+        self._thread = threading.Thread(target=self._dispatch, name="yolo-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"YOLO batching up to {max_batch_size} images, waiting at most {max_wait * 1000:.1f}ms")
+
+    def predict(self, image):
+        """Blocks until the image went through the model, returns its Results in a list"""
+        return self.predict_many([image])
+
+    def predict_many(self, images):
+        """Queues all images at once, they join batches in order. Returns one Results per image"""
+        if self._closed:
+            raise RuntimeError("YOLO batcher is closed")
+
+        futures = []
+        for image in images:
+            future = Future()
+            self._queue.put((image, future, time.perf_counter()))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+
+        batch = [item]
+        deadline = item[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Images that are already waiting always join, even past the deadline
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, stop on the next collect
+                self._queue.put(None)
+                break
+            batch.append(item)
+
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+            self._run(batch)
+
+        # Fail whatever was queued behind the close
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("YOLO batcher is closed"))
+
+    def _run(self, batch):
+
+        start = time.perf_counter()
+        try:
+            results = self.model([image for image, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - start
+
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+        with self._lock:
+            self.batches += 1
+            self.images += len(batch)
+            self.inference_time += elapsed
+            for _, _, enqueued in batch:
+                waited = start - enqueued
+                self.queue_time += waited
+                self.max_queue_time = max(self.max_queue_time, waited)
+
+    def snapshot(self):
+        """Batch fill rate and the latency the batching adds"""
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self.batches,
+                "images": self.images,
+                "avg_batch_size": round(self.images / self.batches, 2) if self.batches else None,
+                "fill_rate": round(self.images / (self.batches * self.max_batch_size), 3) if self.batches else None,
+                "avg_queue_ms": round(self.queue_time / self.images * 1000, 2) if self.images else None,
+                "max_queue_ms": round(self.max_queue_time * 1000, 2),
+                "avg_inference_ms": round(self.inference_time / self.batches * 1000, 2) if self.batches else None,
+            }
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
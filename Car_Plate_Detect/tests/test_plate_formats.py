@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Src"))
+
+from plate_formats import PlateGrammar  # noqa: E402
+
+
+def test_digit_noise_is_not_turned_into_a_plate():
+    grammar = PlateGrammar()
+    for text in ["8800588", "5555555", "00000000", "0000000"]:
+        scored = grammar.read(text)
+        assert scored[0] == (text, 15)
+        assert [candidate for candidate, _ in scored] == [text]
+        assert not grammar.complete(*scored[0])
+        assert grammar.correct(text) == text
+
+
+def test_clean_read_gets_no_corrected_candidates():
+    grammar = PlateGrammar()
+    assert grammar.read("AB12CDE") == [("AB12CDE", 45)]
+    assert grammar.complete("AB12CDE", 45)
+
+
+def test_corrections_are_penalised():
+    grammar = PlateGrammar()
+    scored = grammar.read("A812CDE")
+    assert scored[0] == ("AB12CDE", 40)
+    assert not grammar.complete(*scored[0])
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Src"))
+
+from plate_preprocess import PlatePreprocessor  # noqa: E402
+
+
+def test_results_survive_the_next_call():
+    rng = np.random.default_rng(0)
+    preprocess = PlatePreprocessor()
+    first = preprocess(rng.integers(0, 256, (40, 160, 3), dtype=np.uint8))
+    kept = [image.copy() for image in first]
+
+    second = preprocess(rng.integers(0, 256, (40, 160, 3), dtype=np.uint8))
+
+    assert all(a is not b for a, b in zip(first, second))
+    assert all(np.array_equal(image, copy) for image, copy in zip(first, kept))
@@ -0,0 +1,72 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Src"))
+
+from plate_formats import DEFAULT_CONFUSIONS  # noqa: E402
+from plate_registry import PlateRegistry  # noqa: E402
+
+# A small alphabet heavy in confusable characters keeps registered plates close to each other
+LETTERS = "ABCGIOSZ"
+DIGITS = "0125689"
+CHARACTERS = LETTERS + DIGITS
+PAIRS = {**DEFAULT_CONFUSIONS, **{digit: letter for letter, digit in DEFAULT_CONFUSIONS.items()}}
+
+
+def random_plate(rng):
+    pattern = rng.choice(["AA00AAA", "AAA0000", "000AAA", "AA0000"])
+    return "".join(rng.choice(LETTERS if symbol == "A" else DIGITS) for symbol in pattern)
+
+
+def mutate(rng, plate, edits):
+    """plate with `edits` random substitutions, confusions, insertions or deletions"""
+    chars = list(plate)
+    for _ in range(edits):
+        kind = rng.choice(["substitution", "confusion", "insertion", "deletion"])
+        position = rng.randrange(len(chars))
+        confusable = [i for i, char in enumerate(chars) if char in PAIRS]
+        if kind == "confusion" and confusable:
+            position = rng.choice(confusable)
+            chars[position] = PAIRS[chars[position]]
+        elif kind == "insertion":
+            chars.insert(rng.randrange(len(chars) + 1), rng.choice(CHARACTERS))
+        elif kind == "deletion" and len(chars) > 4:
+            del chars[position]
+        else:
+            chars[position] = rng.choice([char for char in CHARACTERS if char != chars[position]])
+    return "".join(chars)
+
+
+@pytest.mark.parametrize("merge_every", [16, 4096])
+def test_match_agrees_with_brute_force(merge_every):
+    rng = random.Random(merge_every)
+    registry = PlateRegistry(merge_every=merge_every)
+
+    # Bulk loaded, added one by one (pending until the next merge), removed and re-added
+    plates = list(dict.fromkeys(random_plate(rng) for _ in range(400)))
+    registry.add_many(plates[:300])
+    for plate in plates[300:]:
+        registry.add(plate)
+    removed = rng.sample(plates, 60)
+    for plate in removed:
+        assert registry.remove(plate)
+    for plate in removed[:20]:
+        registry.add(plate)
+    registered = [plate for plate in plates if plate in registry]
+    assert len(registered) == len(plates) - 40
+
+    for edits in (1, 2, 3):
+        for _ in range(60):
+            query = mutate(rng, rng.choice(plates), edits)
+            distances = {plate: registry.distance(query, plate) for plate in registered}
+            for max_distance in (1, 2, 3):
+                plate, distance = registry.match(query, max_distance)
+                within = [d for d in distances.values() if d <= max_distance]
+                if not within:
+                    assert (plate, distance) == (None, None), query
+                else:
+                    assert distance == min(within), (query, max_distance)
+                    assert distances[plate] == distance
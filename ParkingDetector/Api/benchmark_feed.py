@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+import numpy as np
+from util import classify_features
+from lots import SpotTable
+from occupancy_feed import OccupancyFeed
+
+
+parser = argparse.ArgumentParser(description="Time pushing occupancy deltas to many idle subscribers")
+parser.add_argument("--mask", default="mask_1920_1080.png")
+parser.add_argument("--frames", type=int, default=20)
+parser.add_argument("--subscribers", default="0,100,1000,10000",
+                    help="comma separated subscriber counts, every fourth one watches the whole lot")
+args = parser.parse_args()
+
+
+def read_frames(n_frames, shape):
+    # Noise reads as empty and black as occupied, a black band of random width changes a few spots per frame
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(n_frames):
+        frame = rng.integers(0, 256, shape, dtype=np.uint8)
+        start = int(rng.integers(0, shape[1]))
+        frame[:, start:start + int(rng.integers(0, 200))] = 0
+        frames.append(frame)
+    return frames
+
+
+async def run(table, frames, n_subscribers):
+    feed = OccupancyFeed("bench", table)
+    n_regions = len(table.region_names)
+
+    tracemalloc.start()
+    subscriptions = [feed.subscribe(None if i % 4 == 0 else i // 4 % n_regions) for i in range(n_subscribers)]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    received = 0
+
+    async def client(subscription):
+        nonlocal received
+        while True:
+            await subscription.get()
+            received += 1
+
+    clients = [asyncio.create_task(client(subscription)) for subscription in subscriptions]
+    await asyncio.sleep(0)
+    received = 0  # the snapshots on connect
+
+    classify_time = publish_time = deliver_time = 0.0
+    classify_calls = 0
+    for frame in frames:
+        start = time.perf_counter()
+        status = classify_features(table.resampler.features(frame))
+        classify_calls += 1
+        classify_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        feed.set_status(status)
+        publish_time += time.perf_counter() - start
+
+        # Every subscriber of a topic the frame touched gets one message
+        expected = received + sum(subscription.seq != feed.seq[subscription.region] for subscription in subscriptions)
+        start = time.perf_counter()
+        while received < expected:
+            await asyncio.sleep(0)
+        deliver_time += time.perf_counter() - start
+
+    for task in clients:
+        task.cancel()
+    await asyncio.gather(*clients, return_exceptions=True)
+
+    n = len(frames)
+    print(f"{n_subscribers:>6} subscribers: classify {classify_time / n * 1e3:7.2f} ms/frame "
+          f"({classify_calls / n:.0f} call), publish {publish_time / n * 1e3:7.2f} ms/frame, "
+          f"deliver {deliver_time / n * 1e3:7.2f} ms/frame, {received / n:8.0f} messages/frame, "
+          f"{memory / max(n_subscribers, 1) / 1024:5.1f} KiB/subscriber")
+
+
+table = SpotTable.compile("bench", args.mask)
+frames = read_frames(args.frames, table.shape + (3,))
+
+for count in args.subscribers.split(","):
+    asyncio.run(run(table, frames, int(count)))
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from util import get_parking_spots_bboxes, get_region_ids, SpotResampler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGION_NAMES = ["a", "b", "c", "d"]
+CACHE_VERSION = 1
+
+
+def load_region_definitions(mask_path):
+    """Reads the optional <mask>.regions.json that sits next to a mask.
+
+    The file maps region names to [x1, y1, x2, y2] rectangles in mask pixels.
+    A spot belongs to the first region that contains its centre.
+    """
+    path = os.path.splitext(mask_path)[0] + ".regions.json"
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def assign_regions(boxes, regions):
+
+    rects = np.array([regions[name] for name in regions], dtype=np.float64).reshape(-1, 4)
+    cx = boxes[:, 0] + boxes[:, 2] / 2
+    cy = boxes[:, 1] + boxes[:, 3] / 2
+
+    inside = ((cx[:, None] >= rects[:, 0]) & (cx[:, None] < rects[:, 2]) &
+              (cy[:, None] >= rects[:, 1]) & (cy[:, None] < rects[:, 3]))
+
+    outside = np.flatnonzero(~inside.any(axis=1))
+    if len(outside):
+        x, y, w, h = boxes[outside[0]]
+        raise ValueError(f"{len(outside)} spots are outside every region, first one at ({x}, {y}, {w}, {h})")
+
+    return inside.argmax(axis=1)
+
+
+class SpotTable:
+    """Immutable description of one lot, compiled once from its mask.
+
+    Holds the spot boxes as an int32 (N, 4) array, the region id of every
+    spot and a resampler whose gather indices are already built for frames
+    of the mask's size.
+    """
+
+    def __init__(self, lot_id, shape, boxes, region_ids, region_names, gather_index=None):
+
+        self.lot_id = lot_id
+        self.shape = tuple(int(n) for n in shape[:2])
+        self.boxes = np.ascontiguousarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self.region_ids = np.ascontiguousarray(region_ids, dtype=np.int32)
+        self.region_names = [str(name) for name in region_names]
+        self.region_totals = np.bincount(self.region_ids, minlength=len(self.region_names))
+
+        self.resampler = SpotResampler(self.boxes)
+        if gather_index is None:
+            gather_index = self.resampler.gather_indices(self.shape)
+        else:
+            self.resampler.set_gather_indices(self.shape, gather_index)
+        self.gather_index = gather_index
+
+        for array in (self.boxes, self.region_ids, self.region_totals, self.gather_index):
+            array.flags.writeable = False
+
+    def __len__(self):
+        return len(self.boxes)
+
+    @classmethod
+    def compile(cls, lot_id, mask_path, regions=None):
+
+        mask = cv2.imread(mask_path, 0)
+        if mask is None:
+            raise FileNotFoundError(f"Could not read mask: {mask_path}")
+
+        connected_components = cv2.connectedComponentsWithStats(mask, 4, cv2.CV_32S)
+        boxes = np.array(get_parking_spots_bboxes(connected_components), dtype=np.int32).reshape(-1, 4)
+
+        if regions is None:
+            region_names = DEFAULT_REGION_NAMES
+            region_ids = get_region_ids(boxes, mask.shape[1], len(region_names))
+        else:
+            region_names = list(regions)
+            region_ids = assign_regions(boxes, regions)
+
+        return cls(lot_id, mask.shape, boxes, region_ids, region_names)
+
+    def save(self, path, digest):
+
+        # Write next to the final file and rename, so a crash never leaves half a cache
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, version=CACHE_VERSION, digest=digest, shape=np.array(self.shape),
+                     boxes=self.boxes, region_ids=self.region_ids,
+                     region_names=np.array(self.region_names), gather_index=self.gather_index)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, lot_id, path, digest):
+        """Returns None when the cache is missing or was built from another mask."""
+
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as data:
+            if int(data["version"]) != CACHE_VERSION or str(data["digest"]) != digest:
+                return None
+
+            return cls(lot_id, data["shape"], data["boxes"], data["region_ids"],
+                       data["region_names"], data["gather_index"])
+
+
+class LotRegistry:
+    """Lot id -> SpotTable, compiled on first use and cached on disk next to the mask.
+
+    Compiling holds only that lot's lock, so adding a lot never blocks
+    requests for the lots that are already loaded.
+    """
+
+    def __init__(self):
+
+        self._sources = {}
+        self._tables = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, lot_id, mask_path, regions=None):
+
+        if regions is None:
+            regions = load_region_definitions(mask_path)
+
+        with self._lock:
+            self._sources[lot_id] = (mask_path, regions)
+            self._tables.pop(lot_id, None)
+            self._locks.setdefault(lot_id, threading.Lock())
+
+    def register_dir(self, directory):
+        """Registers every <lot_id>.png mask of a directory."""
+
+        lot_ids = []
+        for name in sorted(os.listdir(directory)):
+            lot_id, ext = os.path.splitext(name)
+            if ext.lower() == ".png":
+                self.register(lot_id, os.path.join(directory, name))
+                lot_ids.append(lot_id)
+
+        return lot_ids
+
+    def __contains__(self, lot_id):
+        return lot_id in self._sources
+
+    def lot_ids(self):
+        return list(self._sources)
+
+    def is_compiled(self, lot_id):
+        return lot_id in self._tables
+
+    def get(self, lot_id):
+
+        table = self._tables.get(lot_id)
+        if table is not None:
+            return table
+
+        with self._lock:
+            if lot_id not in self._sources:
+                raise KeyError(lot_id)
+            mask_path, regions = self._sources[lot_id]
+            lock = self._locks[lot_id]
+
+        with lock:
+            table = self._tables.get(lot_id)
+            if table is None:
+                table = self._tables[lot_id] = self._compile(lot_id, mask_path, regions)
+
+        return table
+
+    def preload(self):
+        for lot_id in self.lot_ids():
+            self.get(lot_id)
+
+    def _compile(self, lot_id, mask_path, regions):
+
+        with open(mask_path, "rb") as f:
+            digest = hashlib.sha1(f.read() + json.dumps(regions, sort_keys=True).encode()).hexdigest()
+
+        cache_path = os.path.splitext(mask_path)[0] + ".spots.npz"
+        table = SpotTable.load(lot_id, cache_path, digest)
+        if table is not None:
+            logger.info(f"Loaded spot table for lot {lot_id} from {cache_path}")
+            return table
+
+        table = SpotTable.compile(lot_id, mask_path, regions)
+        try:
+            table.save(cache_path, digest)
+        except OSError as e:
+            logger.warning(f"Could not cache spot table for lot {lot_id}: {e}")
+
+        logger.info(f"Compiled spot table for lot {lot_id}: {len(table)} spots")
+        return table
@@ -1,48 +1,407 @@
-from fastapi import FastAPI, File, UploadFile
+import asyncio
+import os
+import threading
+import time
+from typing import Optional
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import numpy as np
 import cv2
-from util import get_parking_spots_bboxes, empty_or_not
-from skimage.transform import resize
-import io
+from util import classify_features, OccupancyTracker
+from lots import LotRegistry
+from spot_index import SpotIndex
+from occupancy_store import OccupancyStore, DEFAULT_CAPACITY
+from occupancy_feed import OccupancyFeed
 
 app = FastAPI()
 
-mask = cv2.imread("mask_1920_1080.png", 0)
-connected_components = cv2.connectedComponentsWithStats(mask, 4, cv2.CV_32S)
-spots = get_parking_spots_bboxes(connected_components)
-width = mask.shape[1]
-region_width = width // 4
-
-regions = {"a": [], "b": [], "c": [], "d": []}
-for spot in spots:
-    x, y, w, h = spot
-    if x < region_width:
-        regions["a"].append(spot)
-    elif x < 2 * region_width:
-        regions["b"].append(spot)
-    elif x < 3 * region_width:
-        regions["c"].append(spot)
-    else:
-        regions["d"].append(spot)
+DEFAULT_LOT = "default"
 
-@app.post("/status")
-async def get_status(file: UploadFile = File(...)):
+# Every <lot_id>.png in the lots directory is served as /lots/<lot_id>/...
+registry = LotRegistry()
+registry.register(DEFAULT_LOT, "mask_1920_1080.png")
+lots_dir = os.environ.get("PARKING_LOTS_DIR", "lots")
+if os.path.isdir(lots_dir):
+    registry.register_dir(lots_dir)
+
+# One (tracker, lock) per (lot, camera), the tracker keeps the previous spot means and statuses between uploads
+sessions = {}
+
+# Lot id -> SpotIndex, the latest status of every spot of the lot from any of its cameras
+spot_indexes = {}
+
+# Lot id -> OccupancyFeed, pushes the status changes of the lot to its WebSocket and SSE clients
+feeds = {}
+
+# Every status change of every lot, kept on disk as <lot_id>.occupancy ring buffers of
+# PARKING_HISTORY_CAPACITY changes, 13 bytes each, next to this file unless PARKING_HISTORY_DIR says otherwise
+history_dir = os.environ.get("PARKING_HISTORY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "history"))
+history_capacity = int(os.environ.get("PARKING_HISTORY_CAPACITY", DEFAULT_CAPACITY))
+store = OccupancyStore(history_dir, history_capacity)
+
+
+@app.on_event("startup")
+async def startup_event():
+    await run_in_threadpool(registry.preload)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    store.flush()
+
+
+def region_summary(table, empty, total):
+    return {
+        region: {"empty": int(empty[i]), "total": int(total[i])}
+        for i, region in enumerate(table.region_names)
+    }
+
+
+async def get_table(lot_id):
+    if lot_id not in registry:
+        raise HTTPException(status_code=404, detail=f"Unknown lot: {lot_id}")
+
+    if registry.is_compiled(lot_id):
+        return registry.get(lot_id)
+
+    # Compiling a new lot must not hold up requests for the others
+    return await run_in_threadpool(registry.get, lot_id)
+
+
+def get_spot_index(lot_id, table):
+    index = spot_indexes.get(lot_id)
+    if index is None or index.table is not table:
+        index = spot_indexes[lot_id] = SpotIndex(table)
+
+    return index
+
+
+def get_feed(lot_id, table):
+    feed = feeds.get(lot_id)
+    if feed is None or feed.table is not table:
+        feed = feeds[lot_id] = OccupancyFeed(lot_id, table)
+
+    return feed
+
+
+def get_region_id(table, region):
+    if region is None:
+        return None
+    if region not in table.region_names:
+        raise HTTPException(status_code=404, detail=f"Unknown region: {region}")
+
+    return table.region_names.index(region)
+
+
+def get_history(lot_id, table):
+    return store.history(lot_id, len(table))
+
+
+async def read_frame(file, table):
     contents = await file.read()
     nparr = np.frombuffer(contents, np.uint8)
     frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
-    output = {}
-
-    for region, spots in regions.items():
-        empty = 0
-        for spot in spots:
-            x, y, w, h = spot
-            crop = frame[y:y+h, x:x+w]
-            if empty_or_not(crop):
-                empty += 1
-        output[region] = {
-            "empty": empty,
-            "total": len(spots)
+    if frame is None:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+
+    # Spot boxes are in mask pixels, another resolution would read outside them
+    if frame.shape[:2] != table.shape:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Frame is {frame.shape[1]}x{frame.shape[0]}, lot {table.lot_id} expects "
+                   f"{table.shape[1]}x{table.shape[0]}"
+        )
+
+    return frame
+
+
+@app.get("/lots")
+async def list_lots():
+    return {
+        lot_id: {"compiled": registry.is_compiled(lot_id),
+                 "subscribers": feeds[lot_id].subscriber_count if lot_id in feeds else 0}
+        for lot_id in registry.lot_ids()
+    }
+
+
+def classify_lot(table, frame, index, history):
+    # One feature matrix and one predict call for the whole lot
+    status = classify_features(table.resampler.features(frame))
+    index.set_status(status)
+    history.record(np.arange(len(table)), status)
+
+    return status
+
+
+@app.post("/lots/{lot_id}/status")
+async def get_lot_status(lot_id: str, file: UploadFile = File(...)):
+    table = await get_table(lot_id)
+    frame = await read_frame(file, table)
+
+    # Classifying on the loop would stall every feed subscriber, only publishing stays on it
+    status = await run_in_threadpool(classify_lot, table, frame, get_spot_index(lot_id, table),
+                                     get_history(lot_id, table))
+    get_feed(lot_id, table).set_status(status)
+
+    empty = np.bincount(table.region_ids, weights=status, minlength=len(table.region_names))
+    return region_summary(table, empty, table.region_totals)
+
+
+@app.post("/status")
+async def get_status(file: UploadFile = File(...)):
+    return await get_lot_status(DEFAULT_LOT, file)
+
+
+def update_camera(tracker, lock, frame, index, history):
+    # Uploads of one camera must not interleave, the tracker diffs each frame against the previous one
+    with lock:
+        classified, changed = tracker.update(frame)
+        empty = tracker.status[changed]
+        counts = tracker.region_counts()
+
+    index.update(changed, empty)
+    history.record(changed, empty)
+
+    return classified, changed, empty, counts
+
+
+@app.post("/lots/{lot_id}/cameras/{camera_id}/frame")
+async def post_lot_camera_frame(lot_id: str, camera_id: str, file: UploadFile = File(...)):
+    table = await get_table(lot_id)
+    frame = await read_frame(file, table)
+
+    session = sessions.get((lot_id, camera_id))
+    if session is None:
+        tracker = OccupancyTracker(table.boxes, table.region_ids, len(table.region_names), table.resampler)
+        session = sessions[(lot_id, camera_id)] = (tracker, threading.Lock())
+
+    classified, changed, empty, counts = await run_in_threadpool(
+        update_camera, *session, frame, get_spot_index(lot_id, table), get_history(lot_id, table))
+    get_feed(lot_id, table).publish(changed, empty)
+
+    return {
+        "regions": region_summary(table, *counts),
+        "changed": [
+            {"spot": spot, "region": table.region_names[table.region_ids[spot]], "empty": is_empty}
+            for spot, is_empty in zip(changed.tolist(), empty.tolist())
+        ],
+        "classified": len(classified),
+        "total": len(table)
+    }
+
+
+@app.post("/cameras/{camera_id}/frame")
+async def post_camera_frame(camera_id: str, file: UploadFile = File(...)):
+    return await post_lot_camera_frame(DEFAULT_LOT, camera_id, file)
+
+
+@app.get("/lots/{lot_id}/nearest")
+async def get_nearest_spots(lot_id: str, x: float, y: float, k: int = 1, region: Optional[str] = None):
+    table = await get_table(lot_id)
+
+    if not 1 <= k <= max(len(table), 1):
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {len(table)}")
+
+    region_id = get_region_id(table, region)
+    index = get_spot_index(lot_id, table)
+    spots = []
+    for spot, distance in index.nearest(x, y, k, region_id):
+        cx, cy = index.centres[spot]
+        spots.append({
+            "spot": spot,
+            "region": table.region_names[table.region_ids[spot]],
+            "x": cx,
+            "y": cy,
+            "distance": round(distance, 1)
+        })
+
+    return {
+        "spots": spots,
+        "free": index.free_total if region_id is None else index.region_free[region_id]
+    }
+
+
+@app.get("/nearest")
+async def get_nearest(x: float, y: float, k: int = 1, region: Optional[str] = None):
+    return await get_nearest_spots(DEFAULT_LOT, x, y, k, region)
+
+
+@app.websocket("/lots/{lot_id}/feed")
+async def lot_feed_socket(websocket: WebSocket, lot_id: str, region: Optional[str] = None,
+                          seq: Optional[int] = None):
+    try:
+        table = await get_table(lot_id)
+        region_id = get_region_id(table, region)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+
+    await websocket.accept()
+    subscription = get_feed(lot_id, table).subscribe(region_id, seq)
+
+    # The client may only send "resync", which answers with a snapshot
+    receiver = asyncio.create_task(websocket.receive_text())
+    getter = asyncio.create_task(subscription.get())
+    try:
+        while True:
+            await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                if receiver.result() == "resync":
+                    subscription.resync()
+                    getter.cancel()
+                    getter = asyncio.create_task(subscription.get())
+                receiver = asyncio.create_task(websocket.receive_text())
+            if getter.done():
+                await websocket.send_text(getter.result()[2])
+                getter = asyncio.create_task(subscription.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        getter.cancel()
+        subscription.close()
+
+
+@app.websocket("/feed")
+async def feed_socket(websocket: WebSocket, region: Optional[str] = None, seq: Optional[int] = None):
+    await lot_feed_socket(websocket, DEFAULT_LOT, region, seq)
+
+
+@app.get("/lots/{lot_id}/feed/events")
+async def get_lot_feed_events(lot_id: str, request: Request, region: Optional[str] = None,
+                              seq: Optional[int] = None):
+    table = await get_table(lot_id)
+    region_id = get_region_id(table, region)
+
+    # Browsers reconnect with the id of the last event they got
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        seq = int(last_event_id)
+
+    subscription = get_feed(lot_id, table).subscribe(region_id, seq)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event_seq, event, text = await subscription.get(timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event_seq}\nevent: {event}\ndata: {text}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/feed/events")
+async def get_feed_events(request: Request, region: Optional[str] = None, seq: Optional[int] = None):
+    return await get_lot_feed_events(DEFAULT_LOT, request, region, seq)
+
+
+def history_window(start, end):
+    end = time.time() if end is None else end
+    start = end - 3600 if start is None else start
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    return start, end
+
+
+@app.get("/lots/{lot_id}/occupancy")
+async def get_lot_occupancy(lot_id: str, at: Optional[float] = None):
+    table = await get_table(lot_id)
+    at = time.time() if at is None else at
+
+    try:
+        empty, known = get_history(lot_id, table).status_at(at)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    n_regions = len(table.region_names)
+    return {
+        "time": at,
+        "regions": region_summary(table, np.bincount(table.region_ids, weights=empty, minlength=n_regions),
+                                  table.region_totals),
+        "unknown": int(len(table) - known.sum())
+    }
+
+
+@app.get("/occupancy")
+async def get_occupancy(at: Optional[float] = None):
+    return await get_lot_occupancy(DEFAULT_LOT, at)
+
+
+@app.get("/lots/{lot_id}/utilization")
+async def get_lot_utilization(lot_id: str, start: Optional[float] = None, end: Optional[float] = None):
+    table = await get_table(lot_id)
+    start, end = history_window(start, end)
+
+    try:
+        utilization = get_history(lot_id, table).utilization(
+            start, end, table.region_ids, len(table.region_names))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return {
+        "start": start,
+        "end": end,
+        "regions": {
+            region: None if np.isnan(utilization[i]) else round(float(utilization[i]), 4)
+            for i, region in enumerate(table.region_names)
         }
+    }
+
+
+@app.get("/utilization")
+async def get_utilization(start: Optional[float] = None, end: Optional[float] = None):
+    return await get_lot_utilization(DEFAULT_LOT, start, end)
+
+
+@app.get("/lots/{lot_id}/dwell")
+async def get_lot_dwell(lot_id: str, start: Optional[float] = None, end: Optional[float] = None,
+                        spot: Optional[int] = None):
+    table = await get_table(lot_id)
+    start, end = history_window(start, end)
+
+    if spot is not None and not 0 <= spot < len(table):
+        raise HTTPException(status_code=404, detail=f"Unknown spot: {spot}")
+
+    spots, arrivals, seconds = get_history(lot_id, table).dwell_times(start, end, spot)
+    result = {
+        "start": start,
+        "end": end,
+        "stays": len(seconds),
+        "mean": round(float(seconds.mean()), 1) if len(seconds) else None,
+        "median": round(float(np.median(seconds)), 1) if len(seconds) else None,
+        "max": round(float(seconds.max()), 1) if len(seconds) else None
+    }
+    if spot is not None:
+        result["visits"] = [
+            {"arrival": arrival, "seconds": round(duration, 1)}
+            for arrival, duration in zip(arrivals.tolist(), seconds.tolist())
+        ]
+
+    return result
+
+
+@app.get("/dwell")
+async def get_dwell(start: Optional[float] = None, end: Optional[float] = None, spot: Optional[int] = None):
+    return await get_lot_dwell(DEFAULT_LOT, start, end, spot)
+
+
+@app.delete("/lots/{lot_id}/cameras/{camera_id}")
+async def delete_lot_camera(lot_id: str, camera_id: str):
+    if sessions.pop((lot_id, camera_id), None) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown camera: {camera_id}")
+
+    return {"lot_id": lot_id, "camera_id": camera_id, "deleted": True}
+
 
-    return output
+@app.delete("/cameras/{camera_id}")
+async def delete_camera(camera_id: str):
+    return await delete_lot_camera(DEFAULT_LOT, camera_id)
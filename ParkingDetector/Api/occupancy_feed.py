@@ -0,0 +1,203 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+
+class Subscription:
+    """One client's position in the backlog of a topic.
+
+    get() returns the message after the last one it returned, or a
+    snapshot when the client is new, asked for a resync or fell so far
+    behind that the backlog no longer holds what it missed. Items are
+    (seq, event, text).
+    """
+
+    def __init__(self, feed, region, seq=None):
+
+        self.feed = feed
+        self.region = region
+        self.seq = seq
+        self.snapshot_due = seq is None
+
+    def resync(self):
+        self.snapshot_due = True
+
+    async def get(self, timeout=None):
+
+        feed, region = self.feed, self.region
+        while True:
+            if self.snapshot_due:
+                self.snapshot_due = False
+                item = feed.snapshot(region)
+                self.seq = item[0]
+                return item
+
+            if self.seq < feed.seq[region]:
+                backlog = feed.backlog[region]
+                first = backlog[0][0]
+                item = backlog[self.seq + 1 - first] if self.seq + 1 >= first else None
+                if item is None or item[0] != self.seq + 1:
+                    feed.resyncs += 1
+                    self.snapshot_due = True
+                    continue
+                self.seq = item[0]
+                return item
+
+            published = feed.published_event(region).wait()
+            await (published if timeout is None else asyncio.wait_for(published, timeout))
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+
+class OccupancyFeed:
+    """Occupancy changes of one lot, pushed to the clients subscribed to it.
+
+    Clients subscribe to the whole lot or to one region, each a topic with
+    its own sequence number that grows by one per message, so a client
+    that sees a gap knows it missed something. publish() turns a status
+    update into one JSON delta per topic it touches, serialized once into
+    the topic's backlog, and wakes the topic's waiting clients with one
+    event; every client reads the backlog from its own position. Idle
+    clients cost a small object each and no classifier or serialization
+    work. New clients start with a snapshot, or with the missed deltas if
+    they pass the last seq they saw and it is still in the backlog.
+
+    Clients may wait on other event loops than the one publishing, as
+    under the test client, so they are woken thread-safely per loop.
+    """
+
+    def __init__(self, lot_id, table, backlog=256):
+
+        self.lot_id = lot_id
+        self.table = table
+        self.region_names = list(table.region_names)
+        self.region_ids = np.asarray(table.region_ids)
+        self.region_totals = np.asarray(table.region_totals)
+
+        self.empty = np.zeros(len(self.region_ids), dtype=bool)
+        self.known = np.zeros(len(self.region_ids), dtype=bool)
+        self.region_empty = np.zeros(len(self.region_names), dtype=np.int64)
+
+        # Topic None is the whole lot, topic i region i
+        topics = [None] + list(range(len(self.region_names)))
+        self.seq = {topic: 0 for topic in topics}
+        self.backlog = {topic: deque(maxlen=backlog) for topic in topics}
+        self.subscribers = {topic: set() for topic in topics}
+        self._events = {}
+        self._snapshots = {}
+
+        self.published = 0
+        self.resyncs = 0
+
+    def subscribe(self, region=None, last_seq=None):
+
+        seq, backlog = self.seq[region], self.backlog[region]
+        first = backlog[0][0] if backlog else seq + 1
+        # Resuming works from anywhere the backlog still covers
+        resumable = last_seq is not None and first - 1 <= last_seq <= seq
+
+        subscription = Subscription(self, region, last_seq if resumable else None)
+        self.subscribers[region].add(subscription)
+        return subscription
+
+    def published_event(self, region):
+        """Event set at the next message of a topic, for the running loop."""
+
+        key = (region, asyncio.get_running_loop())
+        event = self._events.get(key)
+        if event is None:
+            event = self._events[key] = asyncio.Event()
+        return event
+
+    def _wake(self, topic):
+
+        for key in [key for key in self._events if key[0] == topic]:
+            event, loop = self._events.pop(key), key[1]
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(event.set)
+
+    def unsubscribe(self, subscription):
+        self.subscribers[subscription.region].discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return sum(len(subscribers) for subscribers in self.subscribers.values())
+
+    def _regions(self, regions):
+        return {
+            self.region_names[i]: {"empty": int(self.region_empty[i]), "total": int(self.region_totals[i])}
+            for i in regions
+        }
+
+    def publish(self, spot_ids, empty):
+        """Applies a status update (True = empty) and pushes what changed, returns the changed spot ids."""
+
+        spot_ids = np.asarray(spot_ids, dtype=np.intp).ravel()
+        empty = np.broadcast_to(np.asarray(empty, dtype=bool), spot_ids.shape)
+
+        changed = ~self.known[spot_ids] | (self.empty[spot_ids] != empty)
+        spot_ids, empty = spot_ids[changed], empty[changed]
+        if not len(spot_ids):
+            return spot_ids
+
+        self.empty[spot_ids] = empty
+        self.known[spot_ids] = True
+        self.region_empty = np.bincount(self.region_ids, weights=self.empty,
+                                        minlength=len(self.region_names)).astype(np.int64)
+
+        regions = self.region_ids[spot_ids]
+        changes = [
+            {"spot": spot, "region": self.region_names[region], "empty": is_empty}
+            for spot, region, is_empty in zip(spot_ids.tolist(), regions.tolist(), empty.tolist())
+        ]
+        changed_regions = np.unique(regions).tolist()
+        now = time.time()
+
+        for topic in [None] + changed_regions:
+            self.seq[topic] += 1
+            message = {
+                "type": "delta",
+                "lot": self.lot_id,
+                "region": None if topic is None else self.region_names[topic],
+                "seq": self.seq[topic],
+                "time": now,
+                "changed": changes if topic is None else [c for c, r in zip(changes, regions) if r == topic],
+                "regions": self._regions(changed_regions if topic is None else [topic])
+            }
+            self.backlog[topic].append((self.seq[topic], "delta", json.dumps(message)))
+
+            self._wake(topic)
+
+        self.published += 1
+        return spot_ids
+
+    def set_status(self, status):
+        """Publishes the status of every spot, True = empty."""
+
+        return self.publish(np.arange(len(self.region_ids)), status)
+
+    def snapshot(self, region=None):
+        """(seq, "snapshot", text) of the current status of a topic, built once per seq."""
+
+        seq = self.seq[region]
+        cached = self._snapshots.get(region)
+        if cached is not None and cached[0] == seq:
+            return cached
+
+        spots = np.arange(len(self.region_ids)) if region is None else np.flatnonzero(self.region_ids == region)
+        message = {
+            "type": "snapshot",
+            "lot": self.lot_id,
+            "region": None if region is None else self.region_names[region],
+            "seq": seq,
+            "time": time.time(),
+            "regions": self._regions(range(len(self.region_names)) if region is None else [region]),
+            "empty": spots[self.empty[spots]].tolist(),
+            "unknown": int(np.sum(~self.known[spots]))
+        }
+        snapshot = self._snapshots[region] = (seq, "snapshot", json.dumps(message))
+        return snapshot
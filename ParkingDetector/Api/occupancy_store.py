@@ -0,0 +1,298 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OCCH"
+VERSION = 1
+HEADER = np.dtype([
+    ("magic", "S4"), ("version", "<u4"), ("capacity", "<u8"), ("n_spots", "<u8"),
+    ("head", "<u8"), ("count", "<u8"), ("last_time", "<f8"),
+])
+HEADER_SIZE = 64
+
+# Bits of a record's state byte
+EMPTY = 1
+FIRST = 2  # first observation of the spot, its state before was unknown
+
+RECORD_SIZE = 8 + 4 + 1  # time, spot id, state
+
+# 2**20 changes, 14 MB per lot: two days at 1 Hz with about six changes a second
+DEFAULT_CAPACITY = 1 << 20
+
+
+def _padded(n):
+    return -(-n // 64) * 64
+
+
+class OccupancyHistory:
+    """Current status and change history of the spots of one lot, in one memory-mapped file.
+
+    The file holds a small header, the current empty and observed bits of
+    every spot as packed bitsets, the time of every spot's last change and
+    a ring buffer of the last `capacity` changes as three column arrays
+    (timestamp, spot id, state byte). Only changes are appended, so the
+    status at any retained time T is the current status with the first
+    change after T of the spots that changed since undone, and the
+    occupied time of a window is a signed sum of its change times.
+
+    Everything lives in the mapping, so the history survives restarts
+    without a database. A file with another spot count or capacity is set
+    aside as <file>.old and a new one started.
+    """
+
+    def __init__(self, path, n_spots, capacity=DEFAULT_CAPACITY):
+
+        self.path = path
+        self.n_spots = int(n_spots)
+        self.capacity = int(capacity)
+        self._lock = threading.RLock()
+
+        bits_size = (self.n_spots + 7) // 8
+        size = (HEADER_SIZE + _padded(2 * bits_size) + _padded(8 * self.n_spots) +
+                RECORD_SIZE * self.capacity)
+
+        if os.path.exists(path) and not self._compatible(path, size):
+            logger.warning(f"Occupancy history {path} does not match the lot, moved to {path}.old")
+            os.replace(path, path + ".old")
+
+        if not os.path.exists(path):
+            raw = np.memmap(path, dtype=np.uint8, mode="w+", shape=(size,))
+            header = raw[:HEADER.itemsize].view(HEADER)
+            header[0] = (MAGIC, VERSION, self.capacity, self.n_spots, 0, 0, 0.0)
+            raw.flush()
+            del raw
+
+        self._raw = np.memmap(path, dtype=np.uint8, mode="r+")
+        self._header = self._raw[:HEADER.itemsize].view(HEADER)
+
+        offset = HEADER_SIZE
+        self._empty_bits = self._raw[offset:offset + bits_size]
+        self._known_bits = self._raw[offset + bits_size:offset + 2 * bits_size]
+        offset += _padded(2 * bits_size)
+        self.last_change = self._raw[offset:offset + 8 * self.n_spots].view("<f8")
+        offset += _padded(8 * self.n_spots)
+        self.times = self._raw[offset:offset + 8 * self.capacity].view("<f8")
+        offset += 8 * self.capacity
+        self.spots = self._raw[offset:offset + 4 * self.capacity].view("<u4")
+        offset += 4 * self.capacity
+        self.states = self._raw[offset:offset + self.capacity]
+
+        self.empty = np.unpackbits(self._empty_bits, count=self.n_spots).astype(bool)
+        self.known = np.unpackbits(self._known_bits, count=self.n_spots).astype(bool)
+
+    def _compatible(self, path, size):
+
+        if os.path.getsize(path) != size:
+            return False
+        header = np.fromfile(path, dtype=HEADER, count=1)[0]
+        return (header["magic"] == MAGIC and header["version"] == VERSION and
+                header["capacity"] == self.capacity and header["n_spots"] == self.n_spots)
+
+    @property
+    def count(self):
+        return int(self._header[0]["count"])
+
+    def __len__(self):
+        return self.count
+
+    def record(self, spot_ids, empty, timestamp=None):
+        """Stores the observed status of some spots, returns how many of them changed."""
+
+        spot_ids = np.asarray(spot_ids, dtype=np.intp).ravel()
+        empty = np.broadcast_to(np.asarray(empty, dtype=bool), spot_ids.shape)
+
+        # A spot listed twice keeps its last status
+        spot_ids, last = np.unique(spot_ids[::-1], return_index=True)
+        empty = empty[::-1][last]
+
+        with self._lock:
+            changed = ~self.known[spot_ids] | (self.empty[spot_ids] != empty)
+            spot_ids, empty = spot_ids[changed], empty[changed]
+            if not len(spot_ids):
+                return 0
+
+            states = empty.astype(np.uint8) | np.where(self.known[spot_ids], 0, FIRST).astype(np.uint8)
+            self.empty[spot_ids] = empty
+            self.known[spot_ids] = True
+            self._empty_bits[:] = np.packbits(self.empty)
+            self._known_bits[:] = np.packbits(self.known)
+
+            header = self._header[0]
+            # Clocks may step back, the buffer must stay sorted by time
+            timestamp = max(time.time() if timestamp is None else float(timestamp), float(header["last_time"]))
+
+            self.last_change[spot_ids] = timestamp
+
+            n = len(spot_ids)
+            head = int(header["head"])
+            if n > self.capacity:
+                spot_ids, states = spot_ids[-self.capacity:], states[-self.capacity:]
+                head = (head + n - self.capacity) % self.capacity
+                n = self.capacity
+            slots = (head + np.arange(n)) % self.capacity
+            self.times[slots] = timestamp
+            self.spots[slots] = spot_ids
+            self.states[slots] = states
+
+            self._header["head"] = (head + n) % self.capacity
+            self._header["count"] = min(int(header["count"]) + n, self.capacity)
+            self._header["last_time"] = timestamp
+
+        return n
+
+    def flush(self):
+        self._raw.flush()
+
+    def _segments(self):
+        """Index ranges of the ring buffer, oldest first."""
+
+        header = self._header[0]
+        count, head = int(header["count"]), int(header["head"])
+        if count < self.capacity:
+            return [(0, count)]
+        return [(head, self.capacity), (0, head)]
+
+    def oldest_time(self):
+        segments = [(start, end) for start, end in self._segments() if end > start]
+        return float(self.times[segments[0][0]]) if segments else None
+
+    def _ranges(self, start_time=None, end_time=None):
+        """Ring buffer index ranges of the changes after start_time up to end_time, oldest first."""
+
+        ranges = []
+        for start, end in self._segments():
+            times = self.times[start:end]
+            first = 0 if start_time is None else int(np.searchsorted(times, start_time, side="right"))
+            last = len(times) if end_time is None else int(np.searchsorted(times, end_time, side="right"))
+            if last > first:
+                ranges.append((start + first, start + last))
+
+        return ranges
+
+    def between(self, start_time=None, end_time=None):
+        """(times, spot ids, states) of the changes after start_time up to end_time, oldest first."""
+
+        ranges = self._ranges(start_time, end_time)
+        if not ranges:
+            return np.zeros(0), np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.uint8)
+
+        return tuple(
+            np.concatenate([column[start:end] for start, end in ranges]).astype(dtype)
+            for column, dtype in ((self.times, np.float64), (self.spots, np.intp), (self.states, np.uint8))
+        )
+
+    def status_at(self, timestamp, chunk=1 << 16):
+        """(empty, observed) bool arrays of every spot as they were at timestamp."""
+
+        with self._lock:
+            oldest = self.oldest_time()
+            if self.count == self.capacity and oldest is not None and timestamp < oldest:
+                raise ValueError(f"History only goes back to {oldest}")
+
+            empty, known = self.empty.copy(), self.known.copy()
+            # Only the spots that changed since need undoing, each by its first change after timestamp
+            pending = self.last_change > timestamp
+            remaining = int(pending.sum())
+
+            for start, end in self._ranges(timestamp):
+                for first in range(start, end, chunk):
+                    if not remaining:
+                        break
+                    spots = self.spots[first:min(first + chunk, end)].astype(np.intp)
+                    spots, index = np.unique(spots, return_index=True)
+                    index, spots = index[pending[spots]], spots[pending[spots]]
+
+                    states = self.states[first + index]
+                    known[spots] = (states & FIRST) == 0
+                    empty[spots] = (states & EMPTY) == 0
+                    pending[spots] = False
+                    remaining -= len(spots)
+
+        empty &= known
+        return empty, known
+
+    def durations(self, start_time, end_time):
+        """(occupied, observed) seconds of every spot between start_time and end_time."""
+
+        # Copied under the lock, a concurrent record() may wrap the ring over the window
+        with self._lock:
+            empty, known = self.status_at(start_time)
+            end_empty, end_known = self.status_at(end_time)
+            times, spots, states = self.between(start_time, end_time)
+
+        occupied = np.where(known & ~empty, -float(start_time), 0.0) + np.where(end_known & ~end_empty, end_time, 0.0)
+        observed = np.where(known, end_time - start_time, 0.0)
+
+        # Changes alternate, so every change to occupied opens a stay at -t and every
+        # change to empty closes one at +t, except a spot's first observation
+        closes = (states & (EMPTY | FIRST)) == EMPTY
+        opens = (states & EMPTY) == 0
+        occupied += np.bincount(spots, weights=times * (closes.astype(np.float64) - opens), minlength=self.n_spots)
+
+        first = np.flatnonzero(states & FIRST)
+        observed += np.bincount(spots[first], weights=end_time - times[first], minlength=self.n_spots)
+
+        return occupied, observed
+
+    def utilization(self, start_time, end_time, region_ids, n_regions):
+        """Occupied share of the observed spot time of every region, NaN for regions never observed."""
+
+        occupied, observed = self.durations(start_time, end_time)
+        occupied = np.bincount(region_ids, weights=occupied, minlength=n_regions)
+        observed = np.bincount(region_ids, weights=observed, minlength=n_regions)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return occupied / observed
+
+    def dwell_times(self, start_time, end_time, spot=None):
+        """(spot ids, arrival times, seconds) of the stays that began and ended in the window."""
+
+        with self._lock:
+            times, spots, states = self.between(start_time, end_time)
+
+        if spot is not None:
+            keep = spots == spot
+            times, spots, states = times[keep], spots[keep], states[keep]
+
+        # Stable sorts of small integers are radix sorts
+        keys = spots.astype(np.uint16) if self.n_spots <= 1 << 16 else spots
+        order = np.argsort(keys, kind="stable")
+        times, spots, states = times[order], spots[order], states[order]
+
+        # A stay is a change to occupied followed by the same spot's change to empty; a spot
+        # first seen occupied was parked before it was watched, so that is no arrival
+        arrived = (states[:-1] & (EMPTY | FIRST)) == 0
+        left = (spots[1:] == spots[:-1]) & ((states[1:] & EMPTY) != 0)
+        stays = np.flatnonzero(arrived & left)
+
+        return spots[stays], times[stays], times[stays + 1] - times[stays]
+
+
+class OccupancyStore:
+    """One OccupancyHistory per lot, as <lot_id>.occupancy files in a directory."""
+
+    def __init__(self, directory, capacity=DEFAULT_CAPACITY):
+
+        self.directory = directory
+        self.capacity = capacity
+        self._histories = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def history(self, lot_id, n_spots):
+
+        with self._lock:
+            history = self._histories.get(lot_id)
+            if history is None or history.n_spots != n_spots:
+                path = os.path.join(self.directory, f"{lot_id}.occupancy")
+                history = self._histories[lot_id] = OccupancyHistory(path, n_spots, self.capacity)
+
+        return history
+
+    def flush(self):
+        for history in list(self._histories.values()):
+            history.flush()
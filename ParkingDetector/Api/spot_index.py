@@ -0,0 +1,145 @@
+import heapq
+import math
+import threading
+
+import numpy as np
+
+
+class SpotIndex:
+    """Nearest free spot queries over the spot centres of one lot.
+
+    Spot centres are bucketed into a uniform grid of a few spots per cell.
+    Next to the occupancy bitmap every cell keeps the set of its free
+    spots and every region its free count, all updated incrementally as
+    spots change. A query walks rings of cells outwards from the point,
+    skips cells without free spots and stops once no unvisited cell can
+    hold anything closer.
+
+    Spots that were never observed count as taken. Updates may come from
+    worker threads while queries run on the event loop.
+    """
+
+    def __init__(self, table, cell_size=None):
+
+        self.table = table
+        self._lock = threading.RLock()
+        boxes = table.boxes.astype(np.float64)
+        centres = boxes[:, :2] + boxes[:, 2:] / 2
+        self.centres = [tuple(centre) for centre in centres.tolist()]
+        self.region_ids = table.region_ids.tolist()
+
+        if cell_size is None:
+            cell_size = 2 * float(np.median(boxes[:, 2:].max(axis=1))) if len(boxes) else 1.0
+        self.cell_size = max(cell_size, 1.0)
+        self.cols = int(table.shape[1] // self.cell_size) + 1
+        self.rows = int(table.shape[0] // self.cell_size) + 1
+
+        self.cell_of = [self._cell(x, y) for x, y in self.centres]
+        self.free = np.zeros(len(self.centres), dtype=bool)
+        self.cell_free = [set() for _ in range(self.rows * self.cols)]
+        self.region_free = [0] * len(table.region_names)
+
+        # (first col, first row, last col, last row) of the cells each region's spots occupy
+        self.bounds = (0, 0, self.cols - 1, self.rows - 1)
+        self.region_bounds = []
+        for region in range(len(table.region_names)):
+            cells = [self.cell_of[spot] for spot in np.flatnonzero(table.region_ids == region).tolist()]
+            cols = [cell % self.cols for cell in cells] or [0]
+            rows = [cell // self.cols for cell in cells] or [0]
+            self.region_bounds.append((min(cols), min(rows), max(cols), max(rows)))
+
+    def _cell(self, x, y):
+        col = min(max(int(x // self.cell_size), 0), self.cols - 1)
+        row = min(max(int(y // self.cell_size), 0), self.rows - 1)
+        return row * self.cols + col
+
+    @property
+    def free_total(self):
+        return sum(self.region_free)
+
+    def update(self, spot_ids, empty):
+        """Sets the status of some spots, e.g. those a tracker update changed."""
+
+        spot_ids = np.asarray(spot_ids, dtype=np.intp).ravel()
+        empty = np.broadcast_to(np.asarray(empty, dtype=bool), spot_ids.shape)
+
+        with self._lock:
+            for spot, is_empty in zip(spot_ids.tolist(), empty.tolist()):
+                if self.free[spot] == is_empty:
+                    continue
+                self.free[spot] = is_empty
+                if is_empty:
+                    self.cell_free[self.cell_of[spot]].add(spot)
+                    self.region_free[self.region_ids[spot]] += 1
+                else:
+                    self.cell_free[self.cell_of[spot]].discard(spot)
+                    self.region_free[self.region_ids[spot]] -= 1
+
+    def set_status(self, status):
+        """Replaces the status of every spot, True = empty."""
+
+        status = np.asarray(status, dtype=bool)
+        with self._lock:
+            changed = np.flatnonzero(status != self.free)
+            self.update(changed, status[changed])
+
+    def _ring(self, col, row, r, bounds):
+        """Cells at Chebyshev distance r from (col, row) within bounds."""
+
+        first_col, first_row, last_col, last_row = bounds
+        top, bottom = row - r, row + r
+        left, right = max(col - r, first_col), min(col + r, last_col)
+        for y in ((top,) if r == 0 else (top, bottom)):
+            if first_row <= y <= last_row:
+                for x in range(left, right + 1):
+                    yield y * self.cols + x
+        if r:
+            for x in (col - r, col + r):
+                if first_col <= x <= last_col:
+                    for y in range(max(top + 1, first_row), min(bottom - 1, last_row) + 1):
+                        yield y * self.cols + x
+
+    def nearest(self, x, y, k=1, region=None):
+        """Up to k (spot id, distance) of the free spots closest to (x, y), closest first.
+
+        region restricts the search to the spots of one region id.
+        """
+
+        with self._lock:
+            return self._nearest(x, y, k, region)
+
+    def _nearest(self, x, y, k, region):
+
+        available = self.free_total if region is None else self.region_free[region]
+        if not available:
+            return []
+
+        bounds = self.bounds if region is None else self.region_bounds[region]
+        row, col = divmod(self._cell(x, y), self.cols)
+        first_col, first_row, last_col, last_row = bounds
+        # Rings closer than that cannot reach the bounds
+        start = max(first_col - col, col - last_col, first_row - row, row - last_row, 0)
+        end = max(col - first_col, last_col - col, row - first_row, last_row - row)
+        found = []
+        kth = math.inf
+
+        for r in range(start, end + 1):
+            # No spot of ring r is closer than (r - 1) cells
+            if (r - 1) * self.cell_size > kth:
+                break
+
+            for cell in self._ring(col, row, r, bounds):
+                spots = self.cell_free[cell]
+                if not spots:
+                    continue
+                for spot in spots:
+                    if region is None or self.region_ids[spot] == region:
+                        sx, sy = self.centres[spot]
+                        found.append((math.hypot(sx - x, sy - y), spot))
+
+            if len(found) == available:
+                break
+            if len(found) >= k:
+                kth = heapq.nsmallest(k, found)[-1][0]
+
+        return [(spot, distance) for distance, spot in heapq.nsmallest(k, found)]
@@ -1,3 +1,4 @@
+import os
 import pickle
 from skimage.transform import resize
 import numpy as np
@@ -6,7 +7,87 @@ import cv2
 Empty = True
 NOT_EMPTY = False
 
-model = pickle.load(open(r"Y:\Graduation project\ParkDetect\ParkingDetector\Api\SVM_model", 'rb'))
+
+class FastSVM:
+    """Inference-only SVM loaded from the .npz written by Model/export_svm.py.
+
+    kinds:
+        "rbf"       - the exact RBF decision function of the fitted SVC,
+                      computed for a whole batch with one float32 matrix product.
+        "nystroem"  - linear model on Nystroem features distilled from the SVC.
+        "rff"       - linear model on random Fourier features distilled from the SVC.
+    """
+
+    kinds = ("rbf", "nystroem", "rff")
+
+    def __init__(self, kind, classes, intercept, gamma, **arrays):
+
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown SVM kind: {kind}")
+
+        self.kind = kind
+        self.classes_ = np.asarray(classes)
+        self.intercept = np.float32(intercept)
+        self.gamma = np.float32(gamma)
+
+        if kind == "rbf":
+            self.support_vectors = arrays["support_vectors"].astype(np.float32)
+            self.dual_coef = arrays["dual_coef"].astype(np.float32)
+            self.support_norms = np.einsum("ij,ij->i", self.support_vectors, self.support_vectors)
+        elif kind == "nystroem":
+            self.components = arrays["components"].astype(np.float32)
+            self.component_norms = np.einsum("ij,ij->i", self.components, self.components)
+            self.normalization = arrays["normalization"].astype(np.float32)
+            self.coef = arrays["coef"].astype(np.float32)
+        else:
+            self.random_weights = arrays["random_weights"].astype(np.float32)
+            self.random_offset = arrays["random_offset"].astype(np.float32)
+            self.coef = arrays["coef"].astype(np.float32)
+
+    @classmethod
+    def load(cls, path):
+
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files}
+
+        return cls(str(arrays.pop("kind")), arrays.pop("classes"), arrays.pop("intercept"),
+                   arrays.pop("gamma"), **arrays)
+
+    def _rbf(self, X, centers, center_norms):
+
+        sq_dist = np.einsum("ij,ij->i", X, X)[:, None] + center_norms[None, :] - 2 * (X @ centers.T)
+        np.maximum(sq_dist, 0, out=sq_dist)
+
+        return np.exp(-self.gamma * sq_dist)
+
+    def decision_function(self, X):
+
+        X = np.asarray(X, dtype=np.float32)
+
+        if self.kind == "rbf":
+            return self._rbf(X, self.support_vectors, self.support_norms) @ self.dual_coef + self.intercept
+
+        if self.kind == "nystroem":
+            features = self._rbf(X, self.components, self.component_norms) @ self.normalization.T
+        else:
+            features = np.cos(X @ self.random_weights + self.random_offset)
+            features *= np.sqrt(2 / self.random_weights.shape[1])
+
+        return features @ self.coef + self.intercept
+
+    def predict(self, X):
+
+        return self.classes_[(self.decision_function(X) > 0).astype(int)]
+
+
+model_path = r"Y:\Graduation project\ParkDetect\ParkingDetector\Api\SVM_model"
+
+# The compact export from Model/export_svm.py is used when it sits next to the pickle
+if os.path.exists(model_path + ".npz"):
+    model = FastSVM.load(model_path + ".npz")
+else:
+    model = pickle.load(open(model_path, 'rb'))
+
 
 def empty_or_not(spot_bgr):
 
@@ -24,6 +105,275 @@ def empty_or_not(spot_bgr):
         return NOT_EMPTY
 
 
+def spot_features(frame, spots):
+
+    flat_data = np.empty((len(spots), 15 * 15 * 3))
+
+    for i, (x1, y1, w, h) in enumerate(spots):
+        img_resized = resize(frame[y1:y1 + h, x1:x1 + w], (15, 15, 3))
+        flat_data[i] = img_resized.flatten()
+
+    return flat_data
+
+
+def classify_features(flat_data):
+
+    if len(flat_data) == 0:
+        return np.zeros(0, dtype=bool)
+
+    y_output = model.predict(flat_data)
+
+    # True where the spot is empty, same convention as empty_or_not
+    return y_output == 0
+
+
+def classify_spots(frame, spots):
+
+    return classify_features(spot_features(frame, spots))
+
+
+class SpotResampler:
+    """Pulls the 15x15 features of every spot out of a frame in one gather.
+
+    The spot boxes of a mask never change, so the source positions of every
+    output cell are computed once here instead of on every resize call.
+
+    modes:
+        "area"    - mean of the source pixels under each cell, read from one
+                    integral image of the frame. Closest to skimage's
+                    anti-aliased resize, the SVM gives the same answer on
+                    about 99% of spots (see benchmark_resampler.py).
+        "nearest" - the source pixel at each cell centre. Fastest, but noisier.
+        "skimage" - the original per-spot skimage resize, for reference.
+    """
+
+    modes = ("area", "nearest", "skimage")
+
+    def __init__(self, spots, size=15, mode="area"):
+
+        if mode not in self.modes:
+            raise ValueError(f"Unknown resampling mode: {mode}")
+
+        self.spots = np.asarray(spots, dtype=np.int32).reshape(-1, 4)
+        self.size = size
+        self.mode = mode
+
+        x1, y1, w, h = (self.spots[:, i, None] for i in range(4))
+        k = np.arange(size)
+
+        # First and one-past-last source row / column of every cell, (N, size).
+        # Cells always cover at least one pixel, even for spots under 15 px.
+        self.y_start = y1 + h * k // size
+        self.y_end = y1 - (-h * (k + 1) // size)
+        self.x_start = x1 + w * k // size
+        self.x_end = x1 - (-w * (k + 1) // size)
+
+        area = (self.y_end - self.y_start)[:, :, None] * (self.x_end - self.x_start)[:, None, :]
+        self.inv_area = (1.0 / (255.0 * area)).astype(np.float32)[..., None]
+
+        self.y_center = y1 + (2 * k + 1) * h // (2 * size)
+        self.x_center = x1 + (2 * k + 1) * w // (2 * size)
+
+        self._index_cache = {}
+
+    def __len__(self):
+        return len(self.spots)
+
+    def _indices(self, row_length, indices):
+
+        key = (row_length, self.mode)
+        if key not in self._index_cache:
+            if self.mode == "area":
+                corners = []
+                for ys in (self.y_start, self.y_end):
+                    for xs in (self.x_start, self.x_end):
+                        corners.append(ys[:, :, None] * row_length + xs[:, None, :])
+                self._index_cache[key] = np.stack(corners)
+            else:
+                self._index_cache[key] = self.y_center[:, :, None] * row_length + self.x_center[:, None, :]
+
+        flat_index = self._index_cache[key]
+        if indices is None:
+            return flat_index
+        return flat_index[..., indices, :, :]
+
+    def _row_length(self, frame_width):
+        # Area mode gathers from the integral image, which has one extra column
+        return frame_width + 1 if self.mode == "area" else frame_width
+
+    def gather_indices(self, frame_shape):
+        """Flat gather indices for frames of this shape, e.g. to cache them on disk."""
+        return self._indices(self._row_length(frame_shape[1]), None)
+
+    def set_gather_indices(self, frame_shape, flat_index):
+        self._index_cache[(self._row_length(frame_shape[1]), self.mode)] = flat_index
+
+    def features(self, frame, indices=None, integral=None):
+        """Returns the (N, 675) float32 feature matrix of the selected spots."""
+
+        if indices is not None:
+            indices = np.asarray(indices, dtype=np.intp)
+            n_spots = len(indices)
+        else:
+            n_spots = len(self.spots)
+
+        if self.mode == "skimage":
+            spots = self.spots if indices is None else self.spots[indices]
+            return spot_features(frame, spots).astype(np.float32)
+
+        channels = frame.shape[2]
+
+        if self.mode == "nearest":
+            flat_index = self._indices(frame.shape[1], indices)
+            pixels = frame.reshape(-1, channels)[flat_index]
+            return pixels.reshape(n_spots, self.size * self.size * channels).astype(np.float32) * np.float32(1 / 255)
+
+        if integral is None:
+            integral = cv2.integral(frame)
+
+        flat_index = self._indices(integral.shape[1], indices)
+        table = integral.reshape(-1, channels)
+        top_left, top_right, bottom_left, bottom_right = (table[i] for i in flat_index)
+        sums = (bottom_right - top_right - bottom_left + top_left).astype(np.float32)
+
+        inv_area = self.inv_area if indices is None else self.inv_area[indices]
+
+        return (sums * inv_area).reshape(n_spots, self.size * self.size * channels)
+
+
+class SpotChangeDetector:
+    """Tracks how much the mean of every spot moved between sampled frames.
+
+    Spot means are read from the box corners of one integral image, and only
+    the per-spot means of the previous frame are kept, not a copy of it.
+    """
+
+    def __init__(self, spots):
+
+        self.spots = np.asarray(spots, dtype=np.int32).reshape(-1, 4)
+        self.previous_means = None
+        self._index_cache = {}
+
+    def __len__(self):
+        return len(self.spots)
+
+    def _indices(self, row_length):
+
+        if row_length not in self._index_cache:
+            x1, y1, w, h = self.spots.T
+            self._index_cache[row_length] = np.stack([
+                y1 * row_length + x1,
+                y1 * row_length + x1 + w,
+                (y1 + h) * row_length + x1,
+                (y1 + h) * row_length + x1 + w,
+            ])
+        return self._index_cache[row_length]
+
+    def means(self, frame, integral=None):
+        """Mean over all pixels and channels of every spot, like np.mean(crop)."""
+
+        if integral is None:
+            integral = cv2.integral(frame)
+
+        channels = integral.shape[2] if integral.ndim == 3 else 1
+        table = integral.reshape(-1, channels)
+        top_left, top_right, bottom_left, bottom_right = (table[i].astype(np.int64) for i in self._indices(integral.shape[1]))
+        sums = (bottom_right - top_right - bottom_left + top_left).sum(axis=1)
+
+        return sums / (self.spots[:, 2] * self.spots[:, 3] * channels)
+
+    def update(self, frame, integral=None):
+        """Returns |mean - previous mean| per spot, or None on the first frame."""
+
+        means = self.means(frame, integral)
+        diffs = None if self.previous_means is None else np.abs(means - self.previous_means)
+        self.previous_means = means
+
+        return diffs
+
+    def reset(self):
+        self.previous_means = None
+
+
+class OccupancyTracker:
+    """Keeps the status of every spot up to date across a stream of frames.
+
+    The first frame classifies every spot. After that only the spots whose
+    mean moved by more than `threshold` of the largest move in their region
+    are classified again, which is the sampling scheme of the video loop.
+    """
+
+    def __init__(self, spots, region_ids, n_regions=None, resampler=None, threshold=0.4):
+
+        self.spots = spots
+        self.region_ids = np.asarray(region_ids)
+        if n_regions is None:
+            n_regions = int(self.region_ids.max()) + 1 if len(self.region_ids) else 0
+        self.n_regions = n_regions
+        self.regions = [np.flatnonzero(self.region_ids == i) for i in range(self.n_regions)]
+        self.threshold = threshold
+
+        # The resampler holds no per-stream state and can be shared between trackers
+        self.resampler = resampler if resampler is not None else SpotResampler(spots)
+        self.change_detector = SpotChangeDetector(spots)
+
+        self.status = np.zeros(len(spots), dtype=bool)
+        self.frames = 0
+        self.classified = 0
+
+    def select(self, diffs):
+
+        if diffs is None:
+            return np.arange(len(self.spots))
+
+        selected = []
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for ids in self.regions:
+                if len(ids):
+                    selected.append(ids[diffs[ids] / np.amax(diffs[ids]) > self.threshold])
+
+        return np.concatenate(selected) if selected else np.zeros(0, dtype=np.intp)
+
+    def update(self, frame, integral=None):
+        """Returns the ids of the spots that were classified and of those whose status flipped."""
+
+        if integral is None:
+            integral = cv2.integral(frame)
+
+        first = self.change_detector.previous_means is None
+        selected = self.select(self.change_detector.update(frame, integral))
+
+        statuses = classify_features(self.resampler.features(frame, selected, integral))
+        changed = selected if first else selected[statuses != self.status[selected]]
+        self.status[selected] = statuses
+
+        self.frames += 1
+        self.classified += len(selected)
+
+        return selected, changed
+
+    def region_counts(self):
+        """Empty and total spots per region."""
+
+        empty = np.bincount(self.region_ids, weights=self.status, minlength=self.n_regions).astype(int)
+        total = np.bincount(self.region_ids, minlength=self.n_regions)
+
+        return empty, total
+
+    def reset(self):
+        self.change_detector.reset()
+        self.status[:] = False
+
+
+def get_region_ids(spots, width, n_regions=4):
+
+    region_width = width // n_regions
+
+    x1 = np.array([spot[0] for spot in spots], dtype=np.int32)
+
+    return np.minimum(x1 // region_width, n_regions - 1)
+
+
 def get_parking_spots_bboxes(connected_components):
 
     (totalLabels , label_ids , values , centroid) = connected_components
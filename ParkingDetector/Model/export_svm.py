@@ -0,0 +1,91 @@
+import argparse
+import os
+import pickle
+
+from skimage.io import imread
+from skimage.transform import resize
+import numpy as np
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import Ridge
+
+
+parser = argparse.ArgumentParser(description="Export the fitted SVC into the compact .npz used by util.FastSVM")
+parser.add_argument("--model", default="SVM_model")
+parser.add_argument("--output", default=None, help="defaults to <model>.npz")
+parser.add_argument("--approximate", choices=["nystroem", "rff"], default=None,
+                    help="distill the SVC into a linear model on approximate kernel features")
+parser.add_argument("--components", type=int, default=100)
+parser.add_argument("--input-dir", default=r"Y:\07 Graduation project\05 Svm_model\clf-data",
+                    help="training images, only needed with --approximate")
+args = parser.parse_args()
+
+categories = ['empty', 'not_empty']
+
+
+def load_data(input_dir):
+    data = []
+    labels = []
+    for category_idx, category in enumerate(categories):
+        for file in os.listdir(os.path.join(input_dir, category)):
+            img = imread(os.path.join(input_dir, category, file))
+            img = resize(img, (15, 15))
+            data.append(img.flatten())
+            labels.append(category_idx)
+
+    return np.asarray(data), np.asarray(labels)
+
+
+model = pickle.load(open(args.model, 'rb'))
+
+if model.kernel != "rbf" or len(model.classes_) != 2:
+    raise SystemExit("Only binary RBF SVC models can be exported")
+
+# sklearn already flips the libsvm sign convention of the public attributes
+# for binary problems: decision > 0 means classes_[1]
+export = {
+    "classes": model.classes_,
+    "gamma": np.float64(model._gamma),
+}
+
+if args.approximate is None:
+    export.update(
+        kind="rbf",
+        support_vectors=model.support_vectors_.astype(np.float32),
+        dual_coef=model.dual_coef_[0].astype(np.float32),
+        intercept=np.float64(model.intercept_[0]),
+    )
+else:
+    data, labels = load_data(args.input_dir)
+
+    # Distill: regress the SVC decision function, so the sign of the linear
+    # model follows the original classifier rather than the raw labels
+    target = model.decision_function(data)
+
+    if args.approximate == "nystroem":
+        sampler = Nystroem(gamma=model._gamma, n_components=args.components, random_state=0)
+    else:
+        sampler = RBFSampler(gamma=model._gamma, n_components=args.components, random_state=0)
+    features = sampler.fit_transform(data)
+
+    linear = Ridge(alpha=1e-3).fit(features, target)
+
+    export.update(kind=args.approximate, coef=linear.coef_.astype(np.float32), intercept=np.float64(linear.intercept_))
+    if args.approximate == "nystroem":
+        export.update(components=sampler.components_.astype(np.float32),
+                      normalization=sampler.normalization_.astype(np.float32))
+    else:
+        export.update(random_weights=sampler.random_weights_.astype(np.float32),
+                      random_offset=sampler.random_offset_.astype(np.float32))
+
+    y_original = model.predict(data)
+    y_approx = model.classes_[(linear.predict(features) > 0).astype(int)]
+
+    print('{} with {} components:'.format(args.approximate, args.components))
+    print('  {:.2f}% agreement with the original classifier'.format(np.mean(y_approx == y_original) * 100))
+    print('  {:.2f}% accuracy (original classifier: {:.2f}%)'.format(
+        np.mean(y_approx == labels) * 100, np.mean(y_original == labels) * 100))
+
+output = args.output or args.model + ".npz"
+np.savez(output, **export)
+
+print('Exported {} model to {} ({} KB)'.format(export["kind"], output, os.path.getsize(output) // 1024))
@@ -0,0 +1,61 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+from util import get_parking_spots_bboxes, classify_features, SpotResampler
+
+
+parser = argparse.ArgumentParser(description="Time the spot resampler modes against the skimage resize path")
+parser.add_argument("--mask", default="mask_1920_1080.png")
+parser.add_argument("--video", default=None, help="video to take frames from, random frames if not given")
+parser.add_argument("--frames", type=int, default=10)
+parser.add_argument("--min-agreement", type=float, default=0.99,
+                    help="smallest accepted share of spots where 'area' mode gives the same SVM answer")
+args = parser.parse_args()
+
+
+def read_frames(video_path, n_frames, shape):
+    if video_path is None:
+        rng = np.random.default_rng(0)
+        return [cv2.GaussianBlur(rng.integers(0, 256, shape, dtype=np.uint8), (15, 15), 0) for _ in range(n_frames)]
+
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < n_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+mask = cv2.imread(args.mask, 0)
+spots = get_parking_spots_bboxes(cv2.connectedComponentsWithStats(mask, 4, cv2.CV_32S))
+frames = read_frames(args.video, args.frames, mask.shape + (3,))
+
+reference = SpotResampler(spots, mode="skimage")
+results = {}
+
+for mode in SpotResampler.modes:
+    resampler = SpotResampler(spots, mode=mode)
+
+    elapsed = 0.0
+    max_error = 0.0
+    agree = 0
+    for frame in frames:
+        start = time.perf_counter()
+        features = resampler.features(frame)
+        elapsed += time.perf_counter() - start
+
+        expected = reference.features(frame)
+        max_error = max(max_error, float(np.abs(features - expected).max()))
+        agree += int(np.sum(classify_features(features) == classify_features(expected)))
+
+    results[mode] = agree / (len(spots) * len(frames))
+    print(f"{mode:>8}: {elapsed / (len(spots) * len(frames)) * 1e6:8.2f} us/spot, "
+          f"max feature error {max_error:.4f}, same SVM answer on {results[mode] * 100:.2f}% of spots")
+
+if results["area"] < args.min_agreement:
+    raise SystemExit(f"'area' mode agreement {results['area']:.4f} is below {args.min_agreement}")
@@ -0,0 +1,80 @@
+import json
+import time
+
+import cv2
+import numpy as np
+
+
+class OccupancyEventWriter:
+    """Writes occupancy changes and periodic region summaries as JSON Lines."""
+
+    def __init__(self, stream, region_names, region_ids):
+
+        self.stream = stream
+        self.region_names = region_names
+        self.region_ids = region_ids
+
+    def write(self, event):
+        self.stream.write(json.dumps(event) + "\n")
+
+    def changes(self, changed, status, frame_nmr, timestamp):
+        for i in changed:
+            self.write({
+                "type": "change",
+                "spot": int(i),
+                "region": self.region_names[self.region_ids[i]],
+                "empty": bool(status[i]),
+                "frame": frame_nmr,
+                "timestamp": round(timestamp, 3),
+            })
+
+    def summary(self, empty, total, frame_nmr, timestamp):
+        self.write({
+            "type": "summary",
+            "frame": frame_nmr,
+            "timestamp": round(timestamp, 3),
+            "regions": {
+                region: {"empty": int(empty[i]), "total": int(total[i])}
+                for i, region in enumerate(self.region_names)
+            },
+        })
+        self.stream.flush()
+
+
+def run_headless(cap, tracker, region_names, stream, step=30, summary_interval=60.0, start_time=0.0, live=False):
+    """Streams occupancy events for a video without drawing anything.
+
+    Frames between samples are only grabbed, not decoded, so recorded video
+    is processed as fast as the sampled frames can be decoded. Timestamps are
+    start_time plus the position in the video for files, and the wall clock
+    for live cameras.
+    """
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    writer = OccupancyEventWriter(stream, region_names, np.asarray(tracker.region_ids))
+    next_summary = None
+    frame_nmr = 0
+
+    while cap.grab():
+        if frame_nmr % step == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+
+            timestamp = time.time() if live else start_time + frame_nmr / fps
+
+            _, changed = tracker.update(frame)
+            writer.changes(changed, tracker.status, frame_nmr, timestamp)
+
+            if next_summary is None or timestamp >= next_summary:
+                writer.summary(*tracker.region_counts(), frame_nmr, timestamp)
+                next_summary = timestamp + summary_interval
+
+        frame_nmr += 1
+
+    if frame_nmr:
+        timestamp = time.time() if live else start_time + (frame_nmr - 1) / fps
+        writer.summary(*tracker.region_counts(), frame_nmr - 1, timestamp)
+
+    return frame_nmr
@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+
+import cv2
+
+
+class DropOldestQueue(queue.Queue):
+    """Bounded queue whose put never blocks: when it is full the oldest item is dropped."""
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.dropped = 0
+
+    def put(self, item, block=True, timeout=None):
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize():
+                self._get()
+                self.unfinished_tasks -= 1
+                self.dropped += 1
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+
+class StageStats:
+    """Frames handled and time spent by one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+        self.start = time.perf_counter()
+
+    def add(self, busy):
+        self.frames += 1
+        self.busy += busy
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        per_frame = self.busy / self.frames * 1000 if self.frames else 0.0
+        return (f"{self.name}: {self.frames / elapsed:6.1f} fps, {per_frame:6.1f} ms/frame, "
+                f"{self.busy / elapsed * 100:5.1f}% busy")
+
+
+class PipelinedRunner:
+    """Decodes, classifies and renders a video on three threads.
+
+    The decoder only grabs the frames that are neither sampled for
+    classification nor displayed, and retrieves (decodes) the others.
+    Stages are connected by small drop-oldest queues, so a slow stage loses
+    stale frames instead of holding up the camera.
+    """
+
+    def __init__(self, cap, tracker, renderer, step=30, display_step=1, queue_size=2, report_interval=5.0):
+
+        self.cap = cap
+        self.tracker = tracker
+        self.renderer = renderer
+        self.step = step
+        self.display_step = display_step
+        self.report_interval = report_interval
+
+        self.classify_queue = DropOldestQueue(queue_size)
+        self.render_queue = DropOldestQueue(queue_size)
+        self.status_queue = DropOldestQueue(1)
+        self.stop_event = threading.Event()
+
+        self.stats = {name: StageStats(name) for name in ("decode", "classify", "render")}
+
+    def _decode(self):
+
+        stats = self.stats["decode"]
+        frame_nmr = 0
+
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            classify = frame_nmr % self.step == 0
+            display = frame_nmr % self.display_step == 0
+
+            if not self.cap.grab():
+                break
+
+            if classify or display:
+                ret, frame = self.cap.retrieve()
+                if not ret:
+                    break
+
+                if classify:
+                    self.classify_queue.put((frame_nmr, frame))
+                if display:
+                    # The renderer draws on a resized copy, so both stages can share the frame
+                    self.render_queue.put((frame_nmr, frame))
+
+            stats.add(time.perf_counter() - start)
+            frame_nmr += 1
+
+        self.classify_queue.put(None)
+        self.render_queue.put(None)
+
+    def _classify(self):
+
+        stats = self.stats["classify"]
+
+        while True:
+            item = self.classify_queue.get()
+            if item is None:
+                break
+
+            frame_nmr, frame = item
+            start = time.perf_counter()
+            self.tracker.update(frame)
+            self.status_queue.put((frame_nmr, self.tracker.status.copy()))
+            stats.add(time.perf_counter() - start)
+
+    def _render(self):
+
+        stats = self.stats["render"]
+        status = self.tracker.status.copy()
+        last_report = time.perf_counter()
+
+        while True:
+            item = self.render_queue.get()
+            if item is None:
+                break
+
+            frame_nmr, frame = item
+            start = time.perf_counter()
+
+            try:
+                _, status = self.status_queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            frame = self.renderer.render(frame, status)
+            cv2.imshow('Parking Status', frame)
+            stats.add(time.perf_counter() - start)
+
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                self.stop_event.set()
+                break
+
+            if self.report_interval and time.perf_counter() - last_report >= self.report_interval:
+                self.print_report()
+                last_report = time.perf_counter()
+
+    def print_report(self):
+        for stats in self.stats.values():
+            print(stats.report())
+        print(f"dropped: {self.classify_queue.dropped} sampled frames, {self.render_queue.dropped} display frames")
+
+    def run(self):
+
+        threads = [
+            threading.Thread(target=self._decode, name="decoder", daemon=True),
+            threading.Thread(target=self._classify, name="classifier", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        # imshow has to run on the main thread on most platforms
+        try:
+            self._render()
+        finally:
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        self.print_report()
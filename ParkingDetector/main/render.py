@@ -0,0 +1,93 @@
+import cv2
+import numpy as np
+
+
+class OverlayRenderer:
+    """Draws the parking status on a display-sized copy of each frame.
+
+    Region boundaries, labels and the counter box never change, so they are
+    drawn once into an overlay at the output size. Spot rectangles are only
+    redrawn when their status flips, and each frame then costs one resize
+    and one masked copy of the overlay.
+    """
+
+    def __init__(self, spots, regions, frame_shape, size=(960, 540)):
+
+        height, width = frame_shape[:2]
+        self.width = width
+        self.height = height
+        self.size = size
+        self.sx = size[0] / width
+        self.sy = size[1] / height
+        self.regions = regions
+
+        spots = np.asarray(spots, dtype=np.int32).reshape(-1, 4)
+        self.boxes = [(self._point(x1, y1), self._point(x1 + w, y1 + h)) for x1, y1, w, h in spots]
+
+        self.overlay = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        self.mask = np.zeros((size[1], size[0]), dtype=np.uint8)
+        self._draw_static()
+
+        # Spot rectangles are drawn under the static layer, it is restored after each redraw
+        self.static = self.overlay.copy()
+        self.static_mask = self.mask.copy()
+        self.status = None
+
+    def _point(self, x, y):
+        return int(round(x * self.sx)), int(round(y * self.sy))
+
+    def _rectangle(self, p1, p2, color, thickness):
+        cv2.rectangle(self.overlay, p1, p2, color, thickness)
+        cv2.rectangle(self.mask, p1, p2, 255, thickness)
+
+    def _text(self, text, org, scale, color):
+        cv2.putText(self.overlay, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale * self.sy, color, 1)
+        cv2.putText(self.mask, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale * self.sy, 255, 1)
+
+    def _draw_static(self):
+
+        region_width = self.width // len(self.regions)
+
+        # Draw region boundaries
+        for i, region in enumerate(self.regions):
+            x_start = i * region_width
+            x_end = (i + 1) * region_width if i < len(self.regions) - 1 else self.width
+            self._rectangle(self._point(x_start, 0), self._point(x_end, self.height), (255, 255, 0), 1)
+            self._text(region, self._point(x_start + 10, 50), 1, (255, 255, 0))
+
+        self._rectangle(self._point(50, 20), self._point(600, 150), (0, 0, 0), -1)
+
+    def _draw_counters(self, status):
+
+        self._rectangle(self._point(50, 20), self._point(600, 150), (0, 0, 0), -1)
+
+        y_offset = 40
+        for region, ids in self.regions.items():
+            text = f"Region {region}: {int(status[ids].sum())} / {len(ids)} available"
+            self._text(text, self._point(60, y_offset), 0.8, (255, 255, 255))
+            y_offset += 30
+
+    def _draw_spots(self, status, dirty):
+
+        for i in dirty:
+            p1, p2 = self.boxes[i]
+            color = (0, 255, 0) if status[i] else (0, 0, 255)
+            self._rectangle(p1, p2, color, 1)
+
+            # Put back the static layer the rectangle may have been drawn over
+            roi = np.s_[max(p1[1] - 1, 0):p2[1] + 2, max(p1[0] - 1, 0):p2[0] + 2]
+            cv2.copyTo(self.static[roi], self.static_mask[roi], self.overlay[roi])
+
+    def render(self, frame, status):
+        """Returns the display-sized frame with the overlay, the input frame is left untouched."""
+
+        dirty = np.arange(len(self.boxes)) if self.status is None else np.flatnonzero(status != self.status)
+        if len(dirty):
+            self._draw_spots(status, dirty)
+            self._draw_counters(status)
+            self.status = status.copy()
+
+        output = cv2.resize(frame, self.size)
+        cv2.copyTo(self.overlay, self.mask, output)
+
+        return output
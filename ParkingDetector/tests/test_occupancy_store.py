@@ -0,0 +1,46 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Api"))
+
+from occupancy_store import OccupancyHistory  # noqa: E402
+
+
+def test_spot_first_seen_occupied_is_no_arrival(tmp_path):
+    history = OccupancyHistory(str(tmp_path / "lot.occupancy"), 2, capacity=16)
+    history.record([0], [False], timestamp=100)
+    history.record([0], [True], timestamp=200)
+
+    spots, arrivals, seconds = history.dwell_times(50, 300)
+    assert len(spots) == 0
+
+    history.record([0], [False], timestamp=250)
+    history.record([0], [True], timestamp=280)
+    spots, arrivals, seconds = history.dwell_times(50, 300)
+    assert spots.tolist() == [0]
+    assert arrivals.tolist() == [250]
+    assert seconds.tolist() == [30]
+
+
+def test_durations_count_time_before_the_first_change(tmp_path):
+    history = OccupancyHistory(str(tmp_path / "lot.occupancy"), 2, capacity=16)
+    history.record([0, 1], [False, True], timestamp=100)
+    history.record([0], [True], timestamp=200)
+    history.record([1], [False], timestamp=260)
+
+    occupied, observed = history.durations(50, 300)
+    assert occupied.tolist() == [100, 40]
+    assert observed.tolist() == [200, 200]
+
+
+def test_durations_across_the_ring_wrap(tmp_path):
+    history = OccupancyHistory(str(tmp_path / "lot.occupancy"), 1, capacity=4)
+    for i in range(7):
+        history.record([0], [i % 2 == 1], timestamp=100 + 10 * i)
+
+    # Changes at 140 (occupied), 150 (empty), 160 (occupied) are still held
+    occupied, observed = history.durations(135, 170)
+    assert occupied.tolist() == [20]
+    assert observed.tolist() == [35]
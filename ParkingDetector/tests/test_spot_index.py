@@ -0,0 +1,59 @@
+import math
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Api"))
+
+from spot_index import SpotIndex  # noqa: E402
+
+
+def make_table(rng, n_spots=600, shape=(1080, 1920), n_regions=4):
+    # Rows of spots like a lot, jittered, split into vertical regions
+    width, height = 40, 30
+    x = rng.integers(0, shape[1] - width, n_spots)
+    y = (rng.integers(0, shape[0] // height, n_spots) * height + rng.integers(-3, 4, n_spots)).clip(0)
+    boxes = np.stack([x, y, np.full(n_spots, width), np.full(n_spots, height)], axis=1)
+    return SimpleNamespace(
+        boxes=boxes,
+        shape=shape,
+        region_ids=(x * n_regions // shape[1]).astype(np.int32),
+        region_names=[chr(ord("a") + i) for i in range(n_regions)],
+    )
+
+
+def brute_force(index, x, y, region):
+    return sorted(
+        math.hypot(cx - x, cy - y)
+        for spot, (cx, cy) in enumerate(index.centres)
+        if index.free[spot] and (region is None or index.region_ids[spot] == region)
+    )
+
+
+@pytest.mark.parametrize("free_share", [0.01, 0.05, 0.5])
+def test_nearest_agrees_with_brute_force(free_share):
+    rng = np.random.default_rng(int(free_share * 100))
+    table = make_table(rng)
+    index = SpotIndex(table)
+    index.set_status(rng.random(len(table.boxes)) < free_share)
+    # Incremental updates on top of the full status
+    flipped = rng.choice(len(table.boxes), 20, replace=False)
+    index.update(flipped, ~index.free[flipped])
+
+    for _ in range(200):
+        # Points inside and around the frame
+        x, y = rng.uniform(-200, 2120), rng.uniform(-200, 1280)
+        region = None if rng.random() < 0.3 else int(rng.integers(0, 4))
+        k = int(rng.choice([1, 3, 10, 1000]))
+
+        expected = brute_force(index, x, y, region)[:k]
+        found = index.nearest(x, y, k, region)
+
+        assert [distance for _, distance in found] == pytest.approx(expected)
+        for spot, distance in found:
+            assert index.free[spot]
+            assert region is None or index.region_ids[spot] == region
+            assert distance == pytest.approx(math.hypot(index.centres[spot][0] - x, index.centres[spot][1] - y))